@@ -4,25 +4,68 @@ Scraper handles the data formatting, this excel_exporter.py module just exports
 
 """
 
+import functools
 import os
-import pandas as pd
 from datetime import datetime
 
+# xlsxwriter is considerably faster than openpyxl at writing new workbooks;
+# fall back to openpyxl if it isn't installed
+try:
+    import xlsxwriter  # noqa: F401
+    EXCEL_ENGINE = 'xlsxwriter'
+except ImportError:
+    EXCEL_ENGINE = 'openpyxl'
 
-def export_to_excel(data, filename_prefix="data", sheets_config=None, output_dir=None):
+
+# pandas takes around a second to import, so it is only loaded once a workbook is
+# actually written; importing a scraper, or a run that skips its export, never pays for it
+@functools.lru_cache(maxsize=1)
+def _pandas():
+    import pandas
+    return pandas
+
+
+@functools.lru_cache(maxsize=1)
+def _dataframe_converters():
     """
-    Export data to an Excel file in a generic way.
+    Converters keyed by exact type, so the common cases are a single dict lookup.
+    """
+    pd = _pandas()
+    return {
+        pd.DataFrame: lambda data: data,
+        list: pd.DataFrame.from_records,
+        dict: lambda data: pd.DataFrame.from_records([data]),
+    }
+
+
+def _to_dataframe(data):
+    """
+    Convert a DataFrame, list of records, or single record dict into a DataFrame.
+    """
+    converters = _dataframe_converters()
+    converter = converters.get(type(data))
+    if converter is None:
+        # Subclasses (e.g. OrderedDict) miss the exact-type lookup
+        for data_type, type_converter in converters.items():
+            if isinstance(data, data_type):
+                converter = type_converter
+                break
+        else:
+            print(f"Warning: Unsupported data type {type(data)}, converting to DataFrame")
+            return _pandas().DataFrame([data])
+    return converter(data)
+
+
+def export_batch(sheets, filename_prefix="batch", output_dir=None):
+    """
+    Write several sheets into a single Excel workbook with one writer.
     
     Args:
-        data: The main data to export (dict, list, or DataFrame)
-        filename_prefix: Prefix for the filename (default: "data")
-        sheets_config: Dict with sheet configurations. Format:
-                      {
-                          "sheet_name": {
-                              "data": data_for_sheet,
-                              "index": False  # optional
-                          }
-                      }
+        sheets: List of sheet dicts, in order. Format:
+                [{"name": "sheet_name", "data": data_for_sheet, "index": False}]
+                "index" is optional. Repeated names get a numeric suffix, so the
+                output of several prepare_*_sheets() calls can be combined.
+        filename_prefix: Prefix for the filename (default: "batch")
         output_dir: Directory to save the file (default: calling script directory)
     
     Returns:
@@ -43,38 +86,23 @@ def export_to_excel(data, filename_prefix="data", sheets_config=None, output_dir
         excel_filename = f"{filename_prefix}_{timestamp}.xlsx"
         excel_file_path = os.path.join(output_dir, excel_filename)
         
-        # Handle different data types
-        if isinstance(data, pd.DataFrame):
-            main_df = data
-        elif isinstance(data, list):
-            main_df = pd.DataFrame(data)
-        elif isinstance(data, dict):
-            main_df = pd.DataFrame([data])
-        else:
-            print(f"Warning: Unsupported data type {type(data)}, converting to DataFrame")
-            main_df = pd.DataFrame([data])
-        
         # Create Excel file
-        with pd.ExcelWriter(excel_file_path, engine='openpyxl') as writer:
-            # Save main data to first sheet
-            main_df.to_excel(writer, index=False, sheet_name="Summary")
-            
-            # Save additional sheets if configured
-            if sheets_config:
-                for sheet_name, sheet_config in sheets_config.items():
-                    sheet_data = sheet_config["data"]
-                    include_index = sheet_config.get("index", False)
-                    
-                    if isinstance(sheet_data, pd.DataFrame):
-                        sheet_df = sheet_data
-                    elif isinstance(sheet_data, list):
-                        sheet_df = pd.DataFrame(sheet_data)
-                    elif isinstance(sheet_data, dict):
-                        sheet_df = pd.DataFrame([sheet_data])
-                    else:
-                        sheet_df = pd.DataFrame([sheet_data])
-                    
-                    sheet_df.to_excel(writer, index=include_index, sheet_name=sheet_name)
+        used_names = set()
+        with _pandas().ExcelWriter(excel_file_path, engine=EXCEL_ENGINE) as writer:
+            for sheet in sheets:
+                # Excel caps sheet names at 31 characters, suffix included
+                sheet_name = sheet["name"][:31]
+                suffix = 2
+                while sheet_name in used_names:
+                    tag = f" ({suffix})"
+                    sheet_name = f"{sheet['name'][:31 - len(tag)]}{tag}"
+                    suffix += 1
+                used_names.add(sheet_name)
+                
+                sheet_df = _to_dataframe(sheet["data"])
+                include_index = sheet.get("index", False)
+                
+                sheet_df.to_excel(writer, index=include_index, sheet_name=sheet_name)
         
         print(f"Data successfully exported to {excel_file_path}")
         return excel_file_path
@@ -84,21 +112,61 @@ def export_to_excel(data, filename_prefix="data", sheets_config=None, output_dir
         return None
 
 
-def export_imagine_data(usage_data):
+def export_to_excel(data, filename_prefix="data", sheets_config=None, output_dir=None):
     """
-    Export Imagine usage data to Excel with proper formatting.
+    Export data to an Excel file in a generic way.
     
     Args:
-        usage_data: Dictionary containing Imagine usage data
+        data: The main data to export (dict, list, or DataFrame)
+        filename_prefix: Prefix for the filename (default: "data")
+        sheets_config: Dict with sheet configurations. Format:
+                      {
+                          "sheet_name": {
+                              "data": data_for_sheet,
+                              "index": False  # optional
+                          }
+                      }
+        output_dir: Directory to save the file (default: calling script directory)
     
     Returns:
         str: Path to the saved Excel file, or None if failed
     """
-    if not usage_data:
-        print("No Imagine usage data provided to export")
-        return None
+    # Determine output directory here, since export_batch would otherwise see this module as the caller
+    if output_dir is None:
+        import inspect
+        caller_frame = inspect.currentframe().f_back
+        caller_file = caller_frame.f_code.co_filename
+        output_dir = os.path.dirname(os.path.abspath(caller_file))
     
-    print("Preparing to export Imagine data to Excel...")
+    return export_batch(
+        _main_and_extra_sheets(data, sheets_config),
+        filename_prefix=filename_prefix,
+        output_dir=output_dir
+    )
+
+
+def _main_and_extra_sheets(data, sheets_config=None):
+    """
+    Convert main data plus a sheets_config dict into the sheet list used by export_batch.
+    """
+    sheets = [{"name": "Summary", "data": data}]
+    for sheet_name, sheet_config in (sheets_config or {}).items():
+        sheets.append({"name": sheet_name, **sheet_config})
+    return sheets
+
+
+def prepare_imagine_sheets(usage_data):
+    """
+    Build the sheet list for Imagine usage data, for use with export_batch.
+    
+    Args:
+        usage_data: Dictionary containing Imagine usage data
+    
+    Returns:
+        list: Sheet dicts, or an empty list if there is no data
+    """
+    if not usage_data:
+        return []
     
     # Prepare breakdown data if available
     sheets_config = {}
@@ -120,16 +188,31 @@ def export_imagine_data(usage_data):
         
         sheets_config["Usage Breakdown"] = {"data": breakdown_data}
     
-    return export_to_excel(
-        data=usage_data,
-        filename_prefix="ImagineUsageData",
-        sheets_config=sheets_config
-    )
+    return _main_and_extra_sheets(usage_data, sheets_config)
 
 
-def export_usms_data(hourly_consumption, total_kwh=None, dynamic_values=None, all_meter_data=None):
+def export_imagine_data(usage_data):
     """
-    Export USMS meter data to Excel with proper formatting.
+    Export Imagine usage data to Excel with proper formatting.
+    
+    Args:
+        usage_data: Dictionary containing Imagine usage data
+    
+    Returns:
+        str: Path to the saved Excel file, or None if failed
+    """
+    if not usage_data:
+        print("No Imagine usage data provided to export")
+        return None
+    
+    print("Preparing to export Imagine data to Excel...")
+    
+    return export_batch(prepare_imagine_sheets(usage_data), filename_prefix="ImagineUsageData")
+
+
+def prepare_usms_sheets(hourly_consumption, total_kwh=None, dynamic_values=None, all_meter_data=None):
+    """
+    Build the sheet list for USMS meter data, for use with export_batch.
     
     Args:
         hourly_consumption: List of hourly consumption data
@@ -138,13 +221,10 @@ def export_usms_data(hourly_consumption, total_kwh=None, dynamic_values=None, al
         all_meter_data: Dictionary containing electricity and water meter data
     
     Returns:
-        str: Path to the saved Excel file, or None if failed
+        list: Sheet dicts, or an empty list if there is no data
     """
     if not hourly_consumption and not all_meter_data:
-        print("No USMS data provided to export")
-        return None
-    
-    print("Preparing to export USMS data to Excel...")
+        return []
     
     # Prepare additional sheets
     sheets_config = {}
@@ -169,8 +249,29 @@ def export_usms_data(hourly_consumption, total_kwh=None, dynamic_values=None, al
     # Use hourly consumption as main data if available, otherwise use meter data
     main_data = hourly_consumption if hourly_consumption else all_meter_data
     
-    return export_to_excel(
-        data=main_data,
-        filename_prefix="MeterData",
-        sheets_config=sheets_config
+    return _main_and_extra_sheets(main_data, sheets_config)
+
+
+def export_usms_data(hourly_consumption, total_kwh=None, dynamic_values=None, all_meter_data=None):
+    """
+    Export USMS meter data to Excel with proper formatting.
+    
+    Args:
+        hourly_consumption: List of hourly consumption data
+        total_kwh: Total consumption value
+        dynamic_values: Dictionary of dynamic values (Remaining Unit, Balance, etc.)
+        all_meter_data: Dictionary containing electricity and water meter data
+    
+    Returns:
+        str: Path to the saved Excel file, or None if failed
+    """
+    if not hourly_consumption and not all_meter_data:
+        print("No USMS data provided to export")
+        return None
+    
+    print("Preparing to export USMS data to Excel...")
+    
+    return export_batch(
+        prepare_usms_sheets(hourly_consumption, total_kwh, dynamic_values, all_meter_data),
+        filename_prefix="MeterData"
     )
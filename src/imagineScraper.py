@@ -1,287 +1,263 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
-from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.common.action_chains import ActionChains
 from selenium.common.exceptions import TimeoutException
+import hashlib
 import json
-import time
 import os
-from mqtt_publisher import publish_imagine_json
+import queue
+import re
+import logging
+import lxml.html
+from mqtt_publisher import publish_imagine_json, set_client_suffix, close_client
 from datetime import datetime, timezone, timedelta
-from excel_exporter import export_imagine_data
+from excel_exporter import export_imagine_data, export_batch, prepare_imagine_sheets
+from scraper_common import load_all_credentials, setup_driver
+from concurrent.futures import ThreadPoolExecutor
 
-def load_credentials(file_path=None, service="Imagine"):
-    if file_path is None:
-        # Get the directory where this script is located
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        file_path = os.path.join(script_dir, "credentials.json")
+log = logging.getLogger(__name__)
+
+# --- Element Locators ---
+SERVICE_NO_LOC = (By.ID, "txtServiceNo")
+ACCOUNT_NO_LOC = (By.ID, "txtAccountNo")
+CHECK_BTN_LOC = (By.ID, "btnCheck")
+USAGE_CONTAINER_LOC = (By.ID, "divBar")
+
+# XPath equivalents of the usage page's CSS selectors, evaluated by lxml on the fetched markup
+USAGE_BAR_XPATH = ".//*[contains(concat(' ', normalize-space(@class), ' '), ' progress-bar ')]//span"
+USAGE_TOTAL_XPATH = (
+    ".//*[contains(concat(' ', normalize-space(@class), ' '), ' col-xs-2 ')"
+    " and contains(concat(' ', normalize-space(@class), ' '), ' col-md-2 ')"
+    " and contains(concat(' ', normalize-space(@class), ' '), ' text-left ')]"
+)
+TOPUP_EXPIRY_XPATH = ".//*[contains(concat(' ', normalize-space(@class), ' '), ' text-muted ')]//i"
+PLAN_TITLE_XPATH = ".//h5"
+FALLBACK_USAGE_SPAN_XPATH = "//span[contains(@style, 'color:black')]"
+
+# Matches progress bar labels such as '2.5 GB Used of 10 GB'
+USAGE_RE = re.compile(r'([\d.]+)\s*GB\s*Used\s*of\s*([\d.]+)\s*GB', re.IGNORECASE)
+
+USAGE_URL = "https://app.imagine.com.bn/online_topup/usage.php"
+# Accounts are scraped concurrently, one headless Chrome per worker
+MAX_WORKERS = 4
+
+# Persistent Chrome profile, reused across runs
+PROFILE_DIR = os.path.join(os.path.expanduser("~"), ".imagine_scraper_profile")
+# Digest of the last exported usage data, used to skip writing duplicate workbooks
+LAST_EXPORT_HASH_FILE = os.path.join(os.path.expanduser("~"), ".imagine_scraper_last_hash")
+
+def _gb_number(text):
+    """Converts a GB figure to an int when it is whole, otherwise a float."""
+    value = float(text)
+    return int(value) if value.is_integer() else value
+
+def parse_usage_gb(usage_string):
+    """
+    Parses a usage string such as '2.5 GB Used of 10 GB'.
+    Returns (used_gb, total_gb), or None if the string is not in that format.
+    """
+    match = USAGE_RE.search(usage_string)
+    if not match:
+        return None
+    return _gb_number(match.group(1)), _gb_number(match.group(2))
+
+def usage_digest(usage_data):
+    """Returns a short stable digest of the scraped usage data."""
+    return hashlib.blake2b(json.dumps(usage_data, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+def load_last_export_hash():
+    """Returns the digest recorded by the last successful export, or None."""
     try:
-        with open(file_path, 'r') as f:
-            creds = json.load(f)
-            # Check if the service exists in the credentials
-            if service not in creds:
-                print(f"Error: Service '{service}' not found in '{file_path}'.")
-                return None, None
-            
-            service_creds = creds[service]
-            # Return serviceNumber and accountNumber for Imagine
-            if service == "Imagine":
-                return service_creds.get("serviceNumber"), service_creds.get("accountNumber")
-            else:
-                print(f"Error: Unknown service '{service}'.")
-                return None, None
-    except FileNotFoundError:
-        print(f"Error: Credentials file '{file_path}' not found.")
-        return None, None
-    except json.JSONDecodeError:
-        print(f"Error: Could not decode JSON from '{file_path}'.")
-        return None, None
-    except KeyError as e:
-        print(f"Error: Required key not found in '{file_path}': {e}")
-        return None, None
+        with open(LAST_EXPORT_HASH_FILE, 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def save_last_export_hash(digest):
+    """Records the digest of a successfully exported dataset."""
+    try:
+        with open(LAST_EXPORT_HASH_FILE, 'w') as f:
+            f.write(digest)
+    except OSError as e:
+        log.warning(f"Could not save export hash: {e}")
+
+def _texts(root, xpath):
+    """Returns the stripped text of every element matching xpath under root."""
+    return [element.text_content().strip() for element in root.xpath(xpath)]
+
+def parse_usage_container(container):
+    """
+    Extracts the raw usage fields from the parsed divBar container markup.
+    Returns a dict of progress bar labels, allowance columns, topup expiry and plan titles.
+    """
+    expiry = _texts(container, TOPUP_EXPIRY_XPATH)
+    return {
+        "bars": _texts(container, USAGE_BAR_XPATH),
+        "cols": _texts(container, USAGE_TOTAL_XPATH),
+        "expiry": expiry[0] if expiry else None,
+        "h5": _texts(container, PLAN_TITLE_XPATH),
+    }
+
+def read_outer_html(driver, element_id):
+    """
+    Returns the outerHTML of the element with the given id using a bare CDP
+    Runtime.evaluate, which skips the argument marshalling and getAttribute atom
+    that execute_script/get_attribute go through. Returns None if it is not found.
+    """
+    result = driver.execute_cdp_cmd("Runtime.evaluate", {
+        "expression": f"(document.getElementById({json.dumps(element_id)}) || {{}}).outerHTML",
+        "returnByValue": True,
+    })
+    return result.get("result", {}).get("value")
 
 def scrape_usage_data(driver):
     usage_data = {}
     
     try:
-        # Wait for the page to load after form submission
-        print("Waiting for usage data to load...")
-        time.sleep(5)
-        
         # Wait for the specific div container to be present
-        print("Looking for usage data container...")
-        usage_container = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.ID, "divBar"))
+        log.info("Looking for usage data container...")
+        WebDriverWait(driver, 10).until(
+            EC.presence_of_element_located(USAGE_CONTAINER_LOC)
         )
-        print("Usage container found!")
+        log.info("Usage container found!")
         
-        # Look for progress bars with usage data
-        progress_bars = usage_container.find_elements(By.CSS_SELECTOR, ".progress-bar span")
+        # Fetch the container markup once and parse it in-process with lxml
+        data = parse_usage_container(lxml.html.fromstring(read_outer_html(driver, USAGE_CONTAINER_LOC[1])))
         
-        for i, span in enumerate(progress_bars):
-            span_text = span.text.strip()
+        # Look for progress bars with usage data
+        for i, span_text in enumerate(data["bars"]):
             if span_text:
                 if "GB Used" in span_text:
                     if i == 0:  # First progress bar is Base Plan
                         usage_data["Base Plan Usage"] = span_text
-                        print(f"Base Plan Usage: {span_text}")
+                        log.info(f"Base Plan Usage: {span_text}")
                     elif i == 1:  # Second progress bar is Topup
                         usage_data["Topup Usage"] = span_text
-                        print(f"Topup Usage: {span_text}")
+                        log.info(f"Topup Usage: {span_text}")
         
         # Also look for the total allowances and expiry information
-        try:
-            # Find all text elements that might contain total allowances
-            col_elements = usage_container.find_elements(By.CSS_SELECTOR, ".col-xs-2.col-md-2.text-left")
-            for i, element in enumerate(col_elements):
-                text = element.text.strip()
-                if "GB" in text:
-                    if i == 0:
-                        usage_data["Base Plan Total"] = text
-                        print(f"Base Plan Total: {text}")
-                    elif i == 1:
-                        usage_data["Topup Total"] = text
-                        print(f"Topup Total: {text}")
-        except Exception as e:
-            print(f"Could not extract total allowances: {e}")
+        for i, text in enumerate(data["cols"]):
+            if "GB" in text:
+                if i == 0:
+                    usage_data["Base Plan Total"] = text
+                    log.info(f"Base Plan Total: {text}")
+                elif i == 1:
+                    usage_data["Topup Total"] = text
+                    log.info(f"Topup Total: {text}")
         
         # Look for expiry information
-        try:
-            expiry_element = usage_container.find_element(By.CSS_SELECTOR, ".text-muted i")
-            expiry_text = expiry_element.text.strip()
-            if expiry_text:
-                usage_data["Topup Expiry"] = expiry_text
-                print(f"Topup Expiry: {expiry_text}")
-        except Exception as e:
-            print(f"Could not find expiry information: {e}")
+        if data["expiry"]:
+            usage_data["Topup Expiry"] = data["expiry"]
+            log.info(f"Topup Expiry: {data['expiry']}")
+        else:
+            log.warning("Could not find expiry information.")
         
         # Look for plan titles
-        try:
-            h5_elements = usage_container.find_elements(By.TAG_NAME, "h5")
-            for h5 in h5_elements:
-                h5_text = h5.text.strip()
-                if h5_text:
-                    print(f"Plan section found: {h5_text}")
-        except Exception as e:
-            print(f"Could not find plan titles: {e}")
+        for h5_text in data["h5"]:
+            if h5_text:
+                log.info(f"Plan section found: {h5_text}")
             
     except TimeoutException:
-        print("Timeout waiting for usage data container. Trying alternative approach...")
+        log.warning("Timeout waiting for usage data container. Trying alternative approach...")
         
         # Alternative approach: look for all spans with usage data
         try:
-            all_spans = driver.find_elements(By.CSS_SELECTOR, "span[style*='color:black']")
-            for i, span in enumerate(all_spans):
-                span_text = span.text.strip()
+            all_spans = _texts(lxml.html.fromstring(driver.page_source), FALLBACK_USAGE_SPAN_XPATH)
+            for i, span_text in enumerate(all_spans):
                 if "GB" in span_text and "Used" in span_text:
                     usage_data[f"Usage Data {i+1}"] = span_text
-                    print(f"Found usage data {i+1}: {span_text}")
+                    log.info(f"Found usage data {i+1}: {span_text}")
         except Exception as e:
-            print(f"Alternative approach failed: {e}")
+            log.warning(f"Alternative approach failed: {e}")
             
     except Exception as e:
-        print(f"Error scraping usage data: {e}")
+        log.error(f"Error scraping usage data: {e}")
     
     return usage_data
 
-def setup_driver():
-    """Initializes and returns a Chrome WebDriver instance."""
+def build_chrome_options(profile_dir=PROFILE_DIR):
+    """
+    Chrome options for the Imagine scraper. Chrome keeps a persistent profile so
+    its HTTP cache survives between runs.
+    """
     options = Options()
-    chrome_exe_paths_to_try = [
-        r"C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe",
-        r"C:\\Program Files (x86)\\Google\\Chrome\\Application\\chrome.exe",
-        rf"C:\\Users\\{os.getlogin()}\\AppData\\Local\\Google\\Chrome\\Application\\chrome.exe"
-    ]
-    found_chrome_binary = False
-    for path_option in chrome_exe_paths_to_try:
-        if os.path.exists(path_option):
-            options.binary_location = path_option
-            print(f"Using Chrome binary location: {path_option}")
-            found_chrome_binary = True
-            break
-    if not found_chrome_binary:
-        print("WARNING: Chrome binary not found at common locations. Selenium will try to locate it automatically.")
-        print(f"Looked in: {chrome_exe_paths_to_try}")
-
-    try:
-        raw_driver_path = ChromeDriverManager().install()
-        print(f"Raw ChromeDriver Path from WDM: {raw_driver_path}")
-    except Exception as e:
-        print(f"Error calling ChromeDriverManager().install(): {e}")
-        print("Please ensure webdriver-manager is installed and can access the internet.")
-        return None
-
-    normalized_driver_path = os.path.normpath(raw_driver_path)
-    
-    potential_path1 = os.path.join(os.path.dirname(normalized_driver_path), "chromedriver.exe")
-    potential_path2 = os.path.join(os.path.dirname(os.path.dirname(normalized_driver_path)), "chromedriver.exe")
-
-    corrected_driver_path = None
-    if os.path.exists(potential_path1):
-        corrected_driver_path = potential_path1
-        print(f"Found ChromeDriver at: {corrected_driver_path}")
-    elif os.path.exists(potential_path2):
-        corrected_driver_path = potential_path2
-        print(f"Found ChromeDriver at: {corrected_driver_path}")
-    else:
-        print(f"Initial path from WDM: {normalized_driver_path}")
-        print(f"Checked for ChromeDriver at: {potential_path1}")
-        print(f"Checked for ChromeDriver at: {potential_path2}")
-        print("ERROR: ChromeDriver executable not found at expected locations within .wdm cache.")
-        print("Please check the .wdm cache structure or webdriver-manager installation.")
-        return None
-
-    print(f"Using final ChromeDriver Path: {corrected_driver_path}")
-    
-    try:
-        driver_service = Service(executable_path=corrected_driver_path)
-        driver = webdriver.Chrome(service=driver_service, options=options)
-        return driver
-    except Exception as e:
-        print(f"Error initializing webdriver.Chrome with path {corrected_driver_path}: {e}")
-        return None
+    options.add_argument(f"--user-data-dir={profile_dir}")
+    # Only a few text nodes are read, so run headless and skip images and unused subsystems
+    options.add_argument("--headless=new")
+    options.add_argument("--window-size=1280,800")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--disable-extensions")
+    options.add_argument("--blink-settings=imagesEnabled=false")
+    options.add_argument("--disable-dev-shm-usage")
+    # Return from driver.get() at DOMContentLoaded; the form fields are reached with explicit waits
+    options.page_load_strategy = "eager"
+    return options
 
-def main():
-    usage_url = "https://app.imagine.com.bn/online_topup/usage.php"
-    service_number, account_number = load_credentials()
-    
-    if not service_number or not account_number:
-        print("Exiting script due to credential loading issues.")
-        return
-    
-    # --- WebDriver Setup ---
-    driver = setup_driver()
-    if not driver:
-        print("Failed to setup WebDriver. Exiting.")
-        return
+def scrape_one(service_number, account_number, driver, service_path="imagine"):
+    """
+    Looks up usage for one Imagine account with the given driver and publishes it via MQTT.
+    Returns the scraped usage data, or an empty dict if nothing could be retrieved.
+    """
+    usage_data = {}
 
-    driver.set_window_size(2576, 1396)
-    
-    print(f"Navigating to usage page: {usage_url}")
-    driver.get(usage_url)
+    log.info(f"Navigating to usage page: {USAGE_URL}")
+    driver.get(USAGE_URL)
     
     try:
-        # Wait for the service number field to be present and enter the service number
-        print("Waiting for service number field...")
-        service_number_field = WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.ID, "txtServiceNo"))
-        )
-        service_number_field.click()
-        service_number_field.clear()
-        service_number_field.send_keys(service_number)
-        print(f"Service number '{service_number}' entered.")
+        # Wait once for the whole form instead of polling each field separately.
+        # The predicate returns the check button once both fields and the button are present and enabled.
+        log.info("Waiting for the usage form...")
+        check_button = WebDriverWait(driver, 10).until(lambda d: d.execute_script(
+            "const els = Array.from(arguments, id => document.getElementById(id));"
+            "return els.every(e => e && !e.disabled) ? els[2] : false;",
+            SERVICE_NO_LOC[1], ACCOUNT_NO_LOC[1], CHECK_BTN_LOC[1]
+        ))
         
-        # Wait for the account number field and enter the account number
-        print("Waiting for account number field...")
-        account_number_field = WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.ID, "txtAccountNo"))
+        # Fill both fields in one script call rather than click/clear/send_keys on each
+        driver.execute_script(
+            "for (const [id, value] of [[arguments[0], arguments[1]], [arguments[2], arguments[3]]]) {"
+            "  const field = document.getElementById(id);"
+            "  field.value = value;"
+            "  field.dispatchEvent(new Event('input', {bubbles: true}));"
+            "  field.dispatchEvent(new Event('change', {bubbles: true}));"
+            "}",
+            SERVICE_NO_LOC[1], service_number, ACCOUNT_NO_LOC[1], account_number
         )
+        log.info(f"Service number '{service_number}' entered.")
+        log.info(f"Account number '{account_number}' entered.")
         
-        # Use ActionChains as shown in the Selenium IDE generated code
-        actions = ActionChains(driver)
-        actions.move_to_element(account_number_field).click_and_hold().perform()
-        
-        # Release the action
-        element = driver.find_element(By.CSS_SELECTOR, ".headings")
-        actions = ActionChains(driver)
-        actions.move_to_element(element).release().perform()
+        check_button.click()
         
-        # Click on wrapper and then enter account number
-        wrapper = driver.find_element(By.CSS_SELECTOR, ".wrapper")
-        wrapper.click()
+        log.info("Check button clicked. Waiting for results...")
         
-        account_number_field.clear()
-        account_number_field.send_keys(account_number)
-        print(f"Account number '{account_number}' entered.")
-        
-        # Find and click the check button
-        print("Waiting for check button...")
-        check_button = WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.ID, "btnCheck"))
-        )
-        
-        # Use ActionChains for the check button as shown in Selenium IDE code
-        actions = ActionChains(driver)
-        actions.move_to_element(check_button).click_and_hold().perform()
-        
-        # Release the action
-        element = driver.find_element(By.CSS_SELECTOR, "center:nth-child(1)")
-        actions = ActionChains(driver)
-        actions.move_to_element(element).release().perform()
-        
-        print("Check button clicked. Waiting for results...")
-        
-        # Wait for form submission and results
-        time.sleep(3)
-          # Check if we successfully got to the results page
+        # Wait for form submission and results; fall through to the URL check below on timeout
+        try:
+            WebDriverWait(driver, 15).until(
+                lambda d: "usage.php" in d.current_url and d.find_elements(*USAGE_CONTAINER_LOC)
+            )
+        except TimeoutException:
+            log.warning("Usage data container did not appear after submitting the form.")
+        # Check if we successfully got to the results page
         if "usage.php" in driver.current_url:
-            print("Successfully submitted form. Attempting to scrape usage data...")
+            log.info("Successfully submitted form. Attempting to scrape usage data...")
             usage_data = scrape_usage_data(driver)
             
             if usage_data:
-                print("\nUsage Data Retrieved:")
+                log.info(f"\nUsage Data Retrieved for service {service_number}:")
                 for key, value in usage_data.items():
-                    print(f"  {key}: {value}")
+                    log.info(f"  {key}: {value}")
                 
                 # Prepare data for MQTT in the desired format
                 mqtt_payload = {}
-                if "Base Plan Usage" in usage_data:
-                    try:
-                        usage_string = usage_data["Base Plan Usage"]
-                        parts = usage_string.lower().split('of')
-                        used_part = parts[0].replace('gb', '').strip()
-                        total_part = parts[1].split('gb')[0].strip()
-                        
-                        mqtt_payload['base_plan_used_gb'] = int(used_part)
-                        mqtt_payload['base_plan_total_gb'] = int(total_part)
-                        
-                    except Exception as e:
-                        print(f"Could not parse 'Base Plan Usage' string: '{usage_data['Base Plan Usage']}'. Error: {e}")
-                        # mqtt_payload will remain empty or without these keys, so publishing will be skipped
+                for usage_key, payload_prefix in (("Base Plan Usage", "base_plan"), ("Topup Usage", "topup")):
+                    if usage_key in usage_data:
+                        parsed = parse_usage_gb(usage_data[usage_key])
+                        if parsed:
+                            mqtt_payload[f'{payload_prefix}_used_gb'], mqtt_payload[f'{payload_prefix}_total_gb'] = parsed
+                        else:
+                            log.warning(f"Could not parse '{usage_key}' string: '{usage_data[usage_key]}'.")
+                            # mqtt_payload will remain without these keys, so publishing will be skipped for the base plan
 
                 if 'base_plan_used_gb' in mqtt_payload and 'base_plan_total_gb' in mqtt_payload: # Condition reverted to use _gb keys
                     # Get current UTC time
@@ -292,49 +268,118 @@ def main():
                     brunei_now = utc_now.astimezone(brunei_tz)
                     # Format time string and append fixed offset
                     mqtt_payload['mqtt_timestamp'] = brunei_now.isoformat()
-                    print(f"\nPrepared MQTT payload: {mqtt_payload}")
-                    print("Attempting to publish data via MQTT...")
+                    log.info(f"\nPrepared MQTT payload: {mqtt_payload}")
+                    log.info("Attempting to publish data via MQTT...")
                     try:
-                        if publish_imagine_json(mqtt_payload):
-                            print("✅ Imagine data published successfully via MQTT.")
+                        if publish_imagine_json(mqtt_payload, service_path):
+                            log.info("✅ Imagine data published successfully via MQTT.")
                         else:
-                            print("❌ Failed to publish Imagine data via MQTT. Check mqtt_publisher logs for details.")
+                            log.error("❌ Failed to publish Imagine data via MQTT. Check mqtt_publisher logs for details.")
                     except Exception as e:
-                        print(f"❌ An error occurred during MQTT publishing: {e}")
+                        log.error(f"❌ An error occurred during MQTT publishing: {e}")
                 else:
-                    print("\nSkipping MQTT publish: Could not prepare 'base_plan_used_gb' and 'base_plan_total_gb' from scraped content.")                # Save to Excel using the exporter module
-                try:
-                    excel_path = export_imagine_data(usage_data)
-                    if excel_path:
-                        print(f"\nData successfully saved to {excel_path}")
-                    else:
-                        print("\nFailed to save data to Excel.")
-                except Exception as e:
-                    print(f"\nError saving data to Excel: {e}")
+                    log.warning("\nSkipping MQTT publish: Could not prepare 'base_plan_used_gb' and 'base_plan_total_gb' from scraped content.")
             else:
-                print("No usage data could be retrieved.")
+                log.warning("No usage data could be retrieved.")
         else:
-            print("Form submission may have failed or redirected to an unexpected page.")
-            print(f"Current URL: {driver.current_url}")
-            print(f"Page title: {driver.title}")
+            log.warning("Form submission may have failed or redirected to an unexpected page.")
+            log.info(f"Current URL: {driver.current_url}")
+            log.info(f"Page title: {driver.title}")
             
             # Print page source for debugging (first 1000 characters)
-            print("Page source (first 1000 chars):")
-            print(driver.page_source[:1000])
+            log.info("Page source (first 1000 chars):")
+            log.info(driver.page_source[:1000])
     
     except TimeoutException as te:
-        print(f"A timeout occurred: {te}")
-        print("Current page source (first 1000 chars):")
-        print(driver.page_source[:1000])
+        log.warning(f"A timeout occurred: {te}")
+        log.info("Current page source (first 1000 chars):")
+        log.info(driver.page_source[:1000])
     except Exception as e:
-        print(f"An error occurred: {e}")
-        print("Current page source (first 1000 chars):")
-        print(driver.page_source[:1000])
+        log.error(f"An error occurred: {e}")
+        log.info("Current page source (first 1000 chars):")
+        log.info(driver.page_source[:1000])
+
+    return usage_data
+
+def export_usage(results):
+    """
+    Exports the scraped usage of every account to Excel, unless nothing changed
+    since the last export. results is a list of (service_number, usage_data).
+    """
+    # Save to Excel using the exporter module, unless nothing changed since the last export
+    digest = usage_digest(results[0][1] if len(results) == 1 else dict(results))
+    if digest == load_last_export_hash():
+        log.info("\nUsage data unchanged since the last export; skipping Excel export.")
+        return
+
+    try:
+        if len(results) == 1:
+            excel_path = export_imagine_data(results[0][1])
+        else:
+            # Several accounts go into one workbook, one set of sheets per account
+            sheets = []
+            for service_number, usage_data in results:
+                for sheet in prepare_imagine_sheets(usage_data):
+                    sheets.append({**sheet, "name": f"{service_number} {sheet['name']}"[:31]})
+            excel_path = export_batch(sheets, filename_prefix="ImagineUsageData")
+        if excel_path:
+            log.info(f"\nData successfully saved to {excel_path}")
+            save_last_export_hash(digest)
+        else:
+            log.warning("\nFailed to save data to Excel.")
+    except Exception as e:
+        log.error(f"\nError saving data to Excel: {e}")
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    set_client_suffix("imagine")
+    accounts = [
+        (service_number, account_number)
+        for service_number, account_number in load_all_credentials(service="Imagine")
+        if service_number and account_number
+    ]
     
+    if not accounts:
+        log.error("Exiting script due to credential loading issues.")
+        return
+    
+    # --- WebDriver Setup ---
+    # One driver per worker; each needs its own profile because Chrome locks a profile while in use
+    drivers = queue.Queue()
+    for slot in range(min(len(accounts), MAX_WORKERS)):
+        profile_dir = PROFILE_DIR if slot == 0 else f"{PROFILE_DIR}-{slot}"
+        driver = setup_driver(build_chrome_options(profile_dir))
+        if driver:
+            drivers.put(driver)
+    if drivers.empty():
+        log.error("Failed to setup WebDriver. Exiting.")
+        return
+
+    def scrape_with_pooled_driver(index, service_number, account_number):
+        driver = drivers.get()
+        try:
+            # The first account keeps the original topic; further accounts get their own
+            service_path = "imagine" if index == 0 else f"imagine/{service_number}"
+            return service_number, scrape_one(service_number, account_number, driver, service_path)
+        finally:
+            drivers.put(driver)
+
+    try:
+        with ThreadPoolExecutor(max_workers=drivers.qsize()) as executor:
+            results = list(executor.map(
+                scrape_with_pooled_driver,
+                range(len(accounts)),
+                *zip(*accounts)
+            ))
+        results = [(service_number, usage_data) for service_number, usage_data in results if usage_data]
+        if results:
+            export_usage(results)
     finally:
-        print("Closing the browser.")
-        time.sleep(2)  # Brief pause before closing
-        driver.quit()
+        log.info("Closing the browser.")
+        while not drivers.empty():
+            drivers.get().quit()
+        # atexit does not run reliably in run_all.py's worker processes; flush and disconnect now
+        close_client()
 
 if __name__ == "__main__":
     main()
@@ -1,9 +1,41 @@
 import paho.mqtt.client as mqtt
+import atexit
+import functools
 import json
 import os
-import time  # Added import for time
+import socket
+import sys
+import threading
 from datetime import datetime, timezone, timedelta
 
+# Brunei time (UTC+8), used for every mqtt_timestamp
+_BRUNEI_TZ = timezone(timedelta(hours=8))
+
+def _now_brunei_iso():
+    return datetime.now(_BRUNEI_TZ).isoformat()
+
+# orjson serializes several times faster and returns bytes, which paho sends as-is;
+# fall back to the standard library if it isn't installed. Either way datetimes are
+# written as ISO 8601, so scrapers can pass a datetime for mqtt_timestamp.
+# credentials.json is decoded with the same library; load_mqtt_config catches a bad file either way.
+try:
+    import orjson
+
+    def _dumps(data):
+        return orjson.dumps(data)
+    _JSON_ERRORS = (TypeError, orjson.JSONEncodeError)
+    _loads = orjson.loads
+except ImportError:
+    def _json_default(value):
+        if isinstance(value, datetime):
+            return value.isoformat()
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+    def _dumps(data):
+        return json.dumps(data, default=_json_default).encode('utf-8')
+    _JSON_ERRORS = (TypeError,)
+    _loads = json.loads
+
 """
 MQTT Publisher for Home Assistant Integration
 
@@ -17,17 +49,30 @@ SIMPLIFIED ARCHITECTURE OVERVIEW:
 - Graceful degradation: if MQTT fails, scrapers continue with Excel export
 - Simple JSON publishing: Only 2 topics total (one per service)
 - Home Assistant will parse JSON payloads using value_json templates
+- Messages are retained by default ("retain_messages" in the mqtt config), so
+  Home Assistant gets the last reading as soon as it subscribes instead of
+  waiting for the next scrape
+- One client per process: it connects on the first publish, keeps the connection
+  alive with a 60s keepalive ping, and is closed at interpreter exit. A long-running
+  scheduler can publish on every run without reconnecting. One-shot scripts call
+  close_client() when they finish, since atexit does not run reliably in
+  run_all.py's worker processes
 
 Scraper handles the data formtting, this mqtt_publisher.py module just sends the data.
 
 """
 
+# Keyed on the file's mtime so an edited credentials.json is picked up without a restart
+@functools.lru_cache(maxsize=1)
+def _read_mqtt_config(credentials_path, mtime_ns):
+    with open(credentials_path, 'rb') as f:
+        creds = _loads(f.read())
+    return creds.get('mqtt')
+
 def load_mqtt_config():
     credentials_path = os.path.join(os.path.dirname(__file__), 'credentials.json')
     try:
-        with open(credentials_path, 'r') as f:
-            creds = json.load(f)
-        mqtt_config = creds.get('mqtt')
+        mqtt_config = _read_mqtt_config(credentials_path, os.stat(credentials_path).st_mtime_ns)
         if not mqtt_config:
             print("MQTT configuration not found in credentials.json")
             return None
@@ -48,132 +93,211 @@ def load_mqtt_config():
         print(f"Error loading MQTT config: {e}")
         return None
 
-def publish_service_json(service_path, data_dict): # Renamed service_name to service_path
-    config = load_mqtt_config()
-    if not config:
-        print("MQTT configuration not available for publishing.")
-        return False
+# Shared client, connected on first publish and reused for the rest of the process
+_client = None
+_client_lock = threading.Lock()
+# Set by each scraper's main() through set_client_suffix(); see get_client
+_client_suffix = None
 
-    client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
-    client.username_pw_set(config['username'], config['password'])
+def set_client_suffix(suffix):
+    """
+    Names this process's MQTT client after the scraper that owns it. Each scraper
+    needs its own client id: with clean_session=False the broker drops whichever
+    client connected first when a second one connects with the same id.
+    """
+    global _client_suffix
+    _client_suffix = suffix
 
-    # Construct the topic using base_topic from config and the provided service_path
-    topic = f"{config['base_topic']}/{service_path}"
-    
-    data_dict_with_ts = data_dict.copy()
-    
-    if 'mqtt_timestamp' not in data_dict_with_ts:
-        # Convert to Brunei time (UTC+8) with proper timezone info
-        utc_now = datetime.now(timezone.utc)
-        brunei_tz = timezone(timedelta(hours=8))
-        brunei_now = utc_now.astimezone(brunei_tz)
-        data_dict_with_ts['mqtt_timestamp'] = brunei_now.isoformat()
+def _on_connect(client, userdata, flags, reason_code, properties):
+    if reason_code == 0:
+        print("Successfully connected to MQTT broker.")
+    else:
+        print(f"Failed to connect to MQTT broker. Return code: {reason_code}")
+        userdata['connect_failed'] = True
+    # Wake get_client as soon as the broker answers, either way
+    userdata['connect_evt'].set()
 
-    try:
-        payload = json.dumps(data_dict_with_ts)
-    except TypeError as e:
-        print(f"Error serializing data to JSON: {e}")
-        return False
+def _on_disconnect(client, userdata, flags, reason_code, properties):
+    rc_value = reason_code.value if hasattr(reason_code, 'value') else reason_code
+    print(f"Disconnected from MQTT broker. Reason code: {rc_value}")
 
-    status = {'connected': False, 'published': False, 'disconnect_reason': None}
-
-    def on_connect(client, userdata, flags, reason_code, properties):
-        if reason_code == 0:
-            print(f"Successfully connected to MQTT broker for publishing to {topic}.")
-            status['connected'] = True
-        else:
-            print(f"Failed to connect to MQTT broker. Return code: {reason_code}")
-            status['connected'] = False
-
-    def on_disconnect(client, userdata, flags, reason_code, properties):
-        rc_value = reason_code.value if hasattr(reason_code, 'value') else reason_code
-        print(f"Disconnected from MQTT broker. Reason code: {rc_value}")
-        status['disconnect_reason'] = rc_value
-
-    def on_publish(client, userdata, mid, reason_code, properties):
-        is_v5_success = hasattr(reason_code, 'value') and reason_code.value == 0
-        is_legacy_success = reason_code == 0 or reason_code is None
-
-        if is_v5_success or is_legacy_success:
-            print(f"Message {mid} published successfully to {topic}.")
-            status['published'] = True
-        else:
-            rc_value = reason_code.value if hasattr(reason_code, 'value') else reason_code
-            print(f"Failed to publish message {mid} to {topic}. Reason code: {rc_value}")
-            status['published'] = False
-
-    client.on_connect = on_connect
-    client.on_disconnect = on_disconnect
-    client.on_publish = on_publish
+def _on_publish(client, userdata, mid, reason_code, properties):
+    # is_published() can't tell a rejected PUBACK from a good one, so only failures are recorded here
+    rc_value = reason_code.value if hasattr(reason_code, 'value') else reason_code
+    if rc_value not in (0, None):
+        print(f"Failed to publish message {mid}. Reason code: {rc_value}")
+        userdata['failed_mids'].add(mid)
 
+def _on_socket_open(client, userdata, sock):
+    # Small JSON payloads shouldn't wait on Nagle's algorithm to coalesce
     try:
-        print(f"Attempting to connect to {config['broker']}:{config['port']} to publish on {topic}")
-        client.connect(config['broker'], config['port'], 60)
-        client.loop_start() 
-
-        connect_timeout = time.time() + 10
-        while not status['connected'] and time.time() < connect_timeout:
-            if status['connected'] is False and status['disconnect_reason'] is not None:
-                 print("Connection explicitly failed by on_connect callback.")
-                 break
-            time.sleep(0.1)
-        
-        if not status['connected']:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except (OSError, AttributeError) as e:
+        print(f"Could not set TCP_NODELAY on MQTT socket: {e}")
+
+def _stop_client(client):
+    """Disconnects a client and stops its network loop. The caller holds _client_lock."""
+    try:
+        client.disconnect()
+    except Exception as e:
+        print(f"Error during disconnect: {e}")
+    client.loop_stop()
+    print("MQTT client loop stopped and disconnect attempt finished.")
+
+def get_client(config):
+    """
+    Returns the shared MQTT client, connecting it on first use.
+    The network loop runs in a background thread and is stopped at interpreter exit.
+    Returns None if the broker cannot be reached.
+    """
+    global _client
+    with _client_lock:
+        if _client is not None and _client.is_connected():
+            return _client
+        if _client is not None:
+            # The old client's loop would keep reconnecting under the same client id and
+            # kick the new one off the broker, so retire it before building a replacement
+            _stop_client(_client)
+            _client = None
+
+        status = {'connect_failed': False, 'failed_mids': set(), 'connect_evt': threading.Event()}
+        # A stable client id with clean_session=False lets the broker resume the session on reconnect.
+        # The suffix keeps scrapers apart even when they share a process name (run_all.py's workers);
+        # without one, fall back to the script name
+        suffix = _client_suffix or os.path.splitext(os.path.basename(sys.argv[0]))[0]
+        client_id = f"{config.get('client_id') or 'electricmeter'}_{suffix}"
+        client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2, client_id=client_id,
+                             clean_session=False, userdata=status)
+        client.username_pw_set(config['username'], config['password'])
+        client.on_connect = _on_connect
+        client.on_disconnect = _on_disconnect
+        client.on_publish = _on_publish
+        client.on_socket_open = _on_socket_open
+        # Bound paho's outgoing queue so a broker outage fails publishes fast instead of piling them up
+        client.max_inflight_messages_set(4)
+        client.max_queued_messages_set(16)
+
+        try:
+            print(f"Attempting to connect to {config['broker']}:{config['port']}")
+            # connect_async lets the network thread do the TCP/MQTT handshake alongside the caller
+            client.connect_async(config['broker'], config['port'], keepalive=60)
+            client.loop_start()
+        except Exception as e:
+            print(f"Error connecting to MQTT broker: {e}")
+            return None
+
+        status['connect_evt'].wait(timeout=10)
+        if status['connect_failed']:
+            print("Connection explicitly failed by on_connect callback.")
+
+        if not client.is_connected():
             print("Connection to MQTT broker failed or timed out.")
-            return False
+            client.loop_stop()
+            return None
 
-        print(f"Publishing message to {topic}: {payload}")
-        retain_flag = bool(config.get('retain_messages', False))
-        msg_info = client.publish(topic, payload, qos=1, retain=retain_flag)
+        _client = client
+        return _client
+
+def close_client():
+    """Stops the shared client's network loop and disconnects it, if it was ever started."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            return
+        _stop_client(_client)
+        _client = None
+
+atexit.register(close_client)
+
+def publish_service_json_batch(items):
+    """
+    Publishes several (service_path, data_dict) messages over the shared connection.
+    All messages are sent before waiting for any PUBACK, so the acknowledgements
+    overlap instead of costing one round-trip each. With the default QoS 0 there
+    is no PUBACK and a message counts as delivered once it is queued.
+    Returns a list of booleans, one per item, True where delivery was confirmed.
+    """
+    config = load_mqtt_config()
+    if not config:
+        print("MQTT configuration not available for publishing.")
+        return [False] * len(items)
+
+    client = get_client(config)
+    if not client:
+        return [False] * len(items)
+
+    retain_flag = bool(config.get('retain_messages', True))
+    # QoS 0 by default: the next scrape overwrites a lost reading, so skip the PUBACK round-trip
+    qos = int(config.get('qos', 0))
+    results = [False] * len(items)
+    pending = []
+
+    for index, (service_path, data_dict) in enumerate(items):
+        # Construct the topic using base_topic from config and the provided service_path
+        topic = f"{config['base_topic']}/{service_path}"
         
+        data_dict_with_ts = data_dict.copy()
+        
+        if 'mqtt_timestamp' not in data_dict_with_ts:
+            data_dict_with_ts['mqtt_timestamp'] = _now_brunei_iso()
+
+        try:
+            payload = _dumps(data_dict_with_ts)
+        except _JSON_ERRORS as e:
+            print(f"Error serializing data to JSON: {e}")
+            continue
+
+        try:
+            print(f"Publishing message to {topic}: {payload.decode('utf-8')}")
+            msg_info = client.publish(topic, payload, qos=qos, retain=retain_flag)
+        except Exception as e:
+            print(f"Error during MQTT operation: {e}")
+            continue
+
+        if msg_info.rc == mqtt.MQTT_ERR_QUEUE_SIZE:
+            print(f"MQTT outgoing queue is full; dropping message to {topic}.")
+            continue
         if msg_info.rc != mqtt.MQTT_ERR_SUCCESS:
             print(f"Publish command failed immediately with RC: {msg_info.rc}")
-            return False
+            continue
+        if qos == 0:
+            # Nothing to acknowledge; queued on the socket counts as delivered
+            results[index] = True
+            continue
+        pending.append((index, msg_info))
 
-        publish_timeout = time.time() + 10
-        while not status['published'] and time.time() < publish_timeout:
-            time.sleep(0.1)
+    for index, msg_info in pending:
+        try:
+            msg_info.wait_for_publish(timeout=10)
+        except Exception as e:
+            print(f"Error during MQTT operation: {e}")
+            continue
 
-        if not status['published']:
+        if not msg_info.is_published() or msg_info.mid in client.user_data_get()['failed_mids']:
             print(f"Publish confirmation not received for message {msg_info.mid} (rc={msg_info.rc}).")
-            return False
-        
-        return True
+            continue
+        results[index] = True
 
-    except Exception as e:
-        print(f"Error during MQTT operation: {e}")
-        return False
-    finally:
-        if client:
-            client.loop_stop()
-            if hasattr(client, '_sock') and client._sock is not None:
-                 try:
-                    client.disconnect()
-                 except Exception as e:
-                    print(f"Error during disconnect: {e}")
-            elif hasattr(client, 'is_connected') and client.is_connected():
-                 try:
-                    client.disconnect()
-                 except Exception as e:
-                    print(f"Error during disconnect (is_connected): {e}")
-            print("MQTT client loop stopped and disconnect attempt finished.")
+    return results
+
+def publish_service_json(service_path, data_dict): # Renamed service_name to service_path
+    return publish_service_json_batch([(service_path, data_dict)])[0]
 
 def publish_usms_json(electricity_data, water_data):
     print("Preparing to publish USMS data to separate topics...")
-    overall_success = True
-    current_timestamp = datetime.now(timezone.utc).astimezone(timezone(timedelta(hours=8))).isoformat()
+    # Only looked up if a reading arrives without its own timestamp
+    current_timestamp = None
+    # Both readings go out together over one connection; see publish_service_json_batch
+    items = []
 
     # Publish Electricity Data
     if electricity_data:
         print("Publishing USMS Electricity Data...")
         # Ensure a consistent timestamp, preferably added by the scraper, but fallback here.
         if 'mqtt_timestamp' not in electricity_data:
+            current_timestamp = _now_brunei_iso()
             electricity_data['mqtt_timestamp'] = current_timestamp
-        
-        if not publish_service_json("usms/electric", electricity_data): # Changed topic here
-            print("❌ Failed to publish USMS Electricity data.")
-            overall_success = False
-        # No explicit success print here, publish_service_json handles it
+        items.append(("usms/electric", electricity_data))
     else:
         print("No electricity data to publish for USMS.")
 
@@ -181,30 +305,41 @@ def publish_usms_json(electricity_data, water_data):
     if water_data:
         print("Publishing USMS Water Data...")
         if 'mqtt_timestamp' not in water_data:
-            water_data['mqtt_timestamp'] = current_timestamp
-
-        if not publish_service_json("usms/water", water_data):
-            print("❌ Failed to publish USMS Water data.")
-            overall_success = False
-        # No explicit success print here, publish_service_json handles it
+            water_data['mqtt_timestamp'] = current_timestamp or _now_brunei_iso()
+        items.append(("usms/water", water_data))
     else:
         print("No water data to publish for USMS.")
 
+    overall_success = True
+    labels = {"usms/electric": "Electricity", "usms/water": "Water"}
+    for (service_path, _), published in zip(items, publish_service_json_batch(items)):
+        if not published:
+            print(f"❌ Failed to publish USMS {labels[service_path]} data.")
+            overall_success = False
+        # No explicit success print here, publish_service_json_batch handles it
+
     return overall_success
 
-def publish_imagine_json(data_dict):
+def publish_imagine_json(data_dict, service_path="imagine"):
     print("Preparing to publish Imagine data (pre-formatted by scraper)...")
     
-    # Validate that the expected keys are present and are integers
-    if not isinstance(data_dict.get('base_plan_used_gb'), int) or \
-       not isinstance(data_dict.get('base_plan_total_gb'), int):
+    # Validate that the expected keys are present and are numbers (whole figures arrive as ints)
+    def is_number(value):
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+    if not is_number(data_dict.get('base_plan_used_gb')) or \
+       not is_number(data_dict.get('base_plan_total_gb')):
         print(f"Error: Data for Imagine is not in the expected format. Received: {data_dict}")
-        print("Expected format: {'base_plan_used_gb': <int>, 'base_plan_total_gb': <int>}")
+        print("Expected format: {'base_plan_used_gb': <number>, 'base_plan_total_gb': <number>}")
         return False
         
     payload_to_publish = {
         'base_plan_used': data_dict['base_plan_used_gb'],
         'base_plan_total': data_dict['base_plan_total_gb']
     }
+    # Topup figures are optional; only published when the account has a topup
+    if is_number(data_dict.get('topup_used_gb')) and is_number(data_dict.get('topup_total_gb')):
+        payload_to_publish['topup_used'] = data_dict['topup_used_gb']
+        payload_to_publish['topup_total'] = data_dict['topup_total_gb']
     
-    return publish_service_json("imagine", payload_to_publish)
+    return publish_service_json(service_path, payload_to_publish)
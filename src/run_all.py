@@ -0,0 +1,36 @@
+from concurrent.futures import ProcessPoolExecutor
+import imagineScraper
+import usmsScraper
+
+"""
+Runs every scraper at once, each in its own process.
+
+Each scraper owns its browsers and MQTT connection, so nothing is shared between
+them; a full run takes as long as the slowest scraper instead of the sum of all.
+
+"""
+
+def run_usms():
+    # No command-line options: a single run rather than polling mode
+    usmsScraper.main([])
+
+def run_imagine():
+    imagineScraper.main()
+
+SCRAPERS = {
+    "USMS": run_usms,
+    "Imagine": run_imagine,
+}
+
+def main():
+    with ProcessPoolExecutor(max_workers=len(SCRAPERS)) as executor:
+        futures = {name: executor.submit(scraper) for name, scraper in SCRAPERS.items()}
+        for name, future in futures.items():
+            try:
+                future.result()
+                print(f"{name} scraper finished.")
+            except Exception as e:
+                print(f"{name} scraper failed: {e}")
+
+if __name__ == "__main__":
+    main()
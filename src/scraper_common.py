@@ -0,0 +1,273 @@
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.support.ui import WebDriverWait
+import functools
+import json
+import logging
+import os
+from lxml import etree
+
+# orjson parses faster; its JSONDecodeError subclasses json's, so callers catch either the same way
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
+
+log = logging.getLogger(__name__)
+
+"""
+Shared helpers for the Electric Meter Scraper scripts.
+
+Credential loading, Chrome/ChromeDriver setup, page-idle waits, the USMS login
+form and meter cards, and USMS consumption grid parsing used to be copied into
+every scraper; they live here so usmsScraper.py, usmsScraperV2.py,
+imagineScraper.py and scraper_headless.py all share one implementation.
+
+"""
+
+DEFAULT_CREDENTIALS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "credentials.json")
+
+# Keys holding each service's credential pair in credentials.json
+CREDENTIAL_KEYS = {
+    "USMS": ("username", "password"),
+    "Imagine": ("serviceNumber", "accountNumber"),
+}
+
+# Keyed on the file's mtime so an edited credentials.json is picked up without a restart
+@functools.lru_cache(maxsize=8)
+def _read_creds_file(file_path, mtime_ns):
+    with open(file_path, 'rb') as f:
+        return _json_loads(f.read())
+
+def load_all_credentials(file_path=None, service="USMS"):
+    """
+    Returns a list of credential pairs for the service. A service section in
+    credentials.json may hold a single account object or a list of them.
+    Returns an empty list if the credentials cannot be loaded.
+    """
+    if file_path is None:
+        file_path = DEFAULT_CREDENTIALS_PATH
+    try:
+        # Repeated calls (e.g. from worker threads) only stat the file while it is unchanged
+        creds = _read_creds_file(file_path, os.stat(file_path).st_mtime_ns)
+        # Check if the service exists in the credentials
+        if service not in creds:
+            log.error(f"Error: Service '{service}' not found in '{file_path}'.")
+            return []
+
+        # For future services, add their keys to CREDENTIAL_KEYS
+        keys = CREDENTIAL_KEYS.get(service)
+        if keys is None:
+            log.error(f"Error: Unknown service '{service}'.")
+            return []
+
+        service_entries = creds[service]
+        if isinstance(service_entries, dict):
+            service_entries = [service_entries]
+        first_key, second_key = keys
+        return [(entry.get(first_key), entry.get(second_key)) for entry in service_entries]
+    except FileNotFoundError:
+        log.error(f"Error: Credentials file '{file_path}' not found.")
+        return []
+    except json.JSONDecodeError:
+        log.error(f"Error: Could not decode JSON from '{file_path}'.")
+        return []
+    except (KeyError, AttributeError) as e:
+        log.error(f"Error: Required key not found in '{file_path}': {e}")
+        return []
+
+def load_credentials(file_path=None, service="USMS"):
+    """Returns the first credential pair for the service, or (None, None) if unavailable."""
+    all_credentials = load_all_credentials(file_path, service)
+    return all_credentials[0] if all_credentials else (None, None)
+
+def setup_driver(options=None, blocked_urls=None):
+    """
+    Initializes and returns a Chrome WebDriver instance, or None on failure.
+    Selenium Manager (bundled with Selenium 4.6+) locates Chrome and downloads a
+    matching ChromeDriver on first use, caching it under ~/.cache/selenium.
+    Requests matching any of blocked_urls (wildcard patterns) are never sent.
+    """
+    if options is None:
+        options = Options()
+
+    try:
+        # keep_alive reuses one pooled HTTP connection to chromedriver for every command
+        driver = webdriver.Chrome(options=options, keep_alive=True)
+    except Exception as e:
+        log.error(f"Error initializing webdriver.Chrome: {e}")
+        return None
+
+    if blocked_urls:
+        try:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": list(blocked_urls)})
+        except Exception as e:
+            # Only a speed-up; the pages still work with everything loading
+            log.warning(f"Could not block URLs via DevTools: {e}")
+    return driver
+
+def build_usms_chrome_options(profile_dir, headless=True):
+    """
+    Chrome options for the USMS scrapers. Chrome keeps a persistent profile so its
+    HTTP cache and cookies survive between runs. Pass headless=False to watch the
+    browser while debugging.
+    """
+    options = Options()
+    options.add_argument(f"--user-data-dir={profile_dir}")
+    options.add_argument("--disk-cache-size=134217728")
+    if headless:
+        options.add_argument("--headless=new")
+    # Set at launch rather than with set_window_size(), which costs an extra command
+    options.add_argument("--window-size=1456,1020")
+    # Only text is read from the portal, so skip images and subsystems a headless run never uses
+    options.add_argument("--disable-gpu")
+    options.add_argument("--disable-extensions")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--blink-settings=imagesEnabled=false")
+    options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+    # Return from driver.get() at DOMContentLoaded; every step after it uses explicit waits
+    options.page_load_strategy = "eager"
+    return options
+
+def submit_usms_login(driver, username, password):
+    """
+    Fills the USMS login form and presses the login button in a single script call.
+    The input/change events are what the DevExpress editors listen for.
+    """
+    driver.execute_script(
+        "const u = document.getElementById('ASPxRoundPanel1_txtUsername_I');"
+        "const p = document.getElementById('ASPxRoundPanel1_txtPassword_I');"
+        "u.value = arguments[0];"
+        "p.value = arguments[1];"
+        "for (const el of [u, p]) {"
+        "  el.dispatchEvent(new Event('input', {bubbles: true}));"
+        "  el.dispatchEvent(new Event('change', {bubbles: true}));"
+        "}"
+        "document.getElementById('ASPxRoundPanel1_btnLogin_CD').click();",
+        username, password,
+    )
+
+def wait(driver, timeout=10):
+    """
+    WebDriverWait polling every 100 ms rather than Selenium's default 500 ms,
+    so each wait returns sooner after its condition is met.
+    """
+    return WebDriverWait(driver, timeout, poll_frequency=0.1)
+
+def page_is_idle(driver):
+    """
+    Expected condition: the document has finished loading and no ASP.NET
+    AJAX partial postback is in flight.
+    """
+    return driver.execute_script(
+        "if (document.readyState !== 'complete') return false;"
+        "if (window.Sys && Sys.WebForms && Sys.WebForms.PageRequestManager) {"
+        "  return !Sys.WebForms.PageRequestManager.getInstance().get_isInAsyncPostBack();"
+        "}"
+        "return true;"
+    )
+
+# (meter index, name, card element id) for the USMS electricity and water cards
+METER_CARDS = (
+    (0, "Electricity", "ASPxCardView1_DXDataCard0"),
+    (1, "Water", "ASPxCardView1_DXDataCard1"),
+)
+
+# Meter card fields, by the layout item number that follows the card's base id
+METER_FIELD_ITEMS = {
+    "Meter No": 2,
+    "Full Name": 4,
+    "Meter Status": 5,
+    "Address": 6,
+    "Kampong": 7,
+    "Mukim": 8,
+    "District": 9,
+    "Postcode": 10,
+    "Remaining Unit": 11,
+    "Remaining Balance": 12,
+    "Last Updated": 17,
+}
+# CSS selectors for every field of the electricity (0) and water (1) cards
+METER_FIELDS = {
+    meter_index: {
+        field_name: f"#ASPxCardView1_DXCardLayout{meter_index}_{item} .dxflNestedControlCell"
+        for field_name, item in METER_FIELD_ITEMS.items()
+    }
+    for meter_index in (0, 1)
+}
+
+def find_meter_cards(driver):
+    """
+    Checks which meter cards are on the current page, all in one script call.
+    Returns a list of (meter_index, meter_name, found) for every entry in METER_CARDS.
+    """
+    present = driver.execute_script(
+        "return arguments[0].map(id => !!document.getElementById(id));",
+        [card_id for _, _, card_id in METER_CARDS],
+    )
+    return [(meter_index, meter_name, found) for (meter_index, meter_name, _), found in zip(METER_CARDS, present)]
+
+def read_meter_fields(driver, meter_index):
+    """
+    Reads every field of one meter card in a single script call. Returns a dict
+    of field name to text, with None for fields that are not on the page.
+    """
+    # innerText matches what Selenium's element.text returns
+    return driver.execute_script(
+        "const out = {};"
+        "for (const [name, selector] of Object.entries(arguments[0])) {"
+        "  const el = document.querySelector(selector);"
+        "  out[name] = el ? el.innerText.trim() : null;"
+        "}"
+        "return out;",
+        METER_FIELDS[meter_index],
+    )
+
+# Compiled once; matches the grid's hourly rows, which carry the 'dxgvDataRow' class
+GRID_ROW_XPATH = etree.XPath(".//tr[contains(concat(' ', normalize-space(@class), ' '), ' dxgvDataRow ')]")
+
+def parse_grid_rows(root):
+    """Extracts the hourly rows from parsed consumption grid markup."""
+    hourly_data = []
+
+    # Find all data rows for hourly consumption
+    # These rows have the class 'dxgvDataRow'
+    data_rows = GRID_ROW_XPATH(root)
+    log.debug(f"Found {len(data_rows)} hourly data rows.")
+
+    for row in data_rows:
+        cols = row.findall(".//td")
+        if len(cols) == 2:
+            hour = cols[0].text_content().strip()
+            consumption = cols[1].text_content().strip()
+            hourly_data.append({"hour": hour, "consumption_kWh": consumption})
+        else:
+            log.warning(f"Skipping row with unexpected number of columns: {row.text_content().strip()}")
+
+    return hourly_data
+
+# The footer's total cell reads like "Total units: 18.240"
+TOTAL_UNITS_LABEL = "Total units:"
+
+def parse_grid_total(root):
+    """Extracts the total consumption from parsed consumption grid footer markup."""
+    total_consumption = None
+
+    # This row has the id 'ASPxPageControl1_grid_DXFooterRow'
+    footer_row = root.get_element_by_id("ASPxPageControl1_grid_DXFooterRow", None)
+    if footer_row is not None:
+        log.debug("Footer row found.")
+        cols = footer_row.findall(".//td")
+        if len(cols) == 2:
+            # The total consumption is in the second 'td'
+            # The text is like "Total units: 18.240"
+            total_text = cols[1].text_content().strip()
+            if total_text.startswith(TOTAL_UNITS_LABEL):
+                total_consumption = total_text[len(TOTAL_UNITS_LABEL):].strip() or None
+        else:
+            log.warning(f"Footer row has unexpected number of columns: {footer_row.text_content().strip()}")
+    else:
+        log.warning("Footer row not found.")
+
+    return total_consumption
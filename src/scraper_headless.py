@@ -2,335 +2,501 @@ from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException
+from selenium.common.exceptions import TimeoutException, ElementClickInterceptedException
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.chrome.options import Options
-import time
 import json # Added for loading credentials
-
-# Function to load credentials from a JSON file
-def load_credentials(file_path=None, service="USMS"):
-    if file_path is None:
-        # Get the directory where this script is located
-        import os
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        file_path = os.path.join(script_dir, "credentials.json")
-    try:
-        with open(file_path, 'r') as f:
-            creds = json.load(f)
-            # Check if the service exists in the credentials
-            if service not in creds:
-                print(f"Error: Service '{service}' not found in '{file_path}'.")
-                return None, None
-            
-            service_creds = creds[service]
-            # Return username and password for USMS, or serviceNumber and accountNumber for other services
-            if service == "USMS":
-                return service_creds.get("username"), service_creds.get("password")
-            elif service == "Imagine":
-                return service_creds.get("serviceNumber"), service_creds.get("accountNumber")
-            else:
-                # For future services, you can add more conditions here
-                print(f"Error: Unknown service '{service}'.")
-                return None, None
-    except FileNotFoundError:
-        print(f"Error: Credentials file '{file_path}' not found.")
-        return None, None
-    except json.JSONDecodeError:
-        print(f"Error: Could not decode JSON from '{file_path}'.")
-        return None, None
-    except KeyError as e:
-        print(f"Error: Required key not found in '{file_path}': {e}")
-        return None, None
-
-def scrape_data_from_table(driver):
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import os
+import lxml.html
+import httpx
+from scraper_common import load_credentials, parse_grid_rows, parse_grid_total, page_is_idle
+
+def scrape_data_from_table(driver, data_table=None):
     """
     Scrapes hourly and total consumption data from the table.
     Assumes the driver is on the page containing the table.
+    Pass data_table if the caller has already located the grid, to skip locating it again.
+    The table and footer markup are fetched in one script call and parsed locally
+    with lxml, so the number of WebDriver round-trips does not grow with the number of rows.
     """
     hourly_data = []
     total_consumption = None
 
     try:
-        # Wait for the main data table to be present
-        data_table = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.ID, "ASPxPageControl1_grid_DXMainTable"))
-        )
+        if data_table is None:
+            # Wait for the main data table to be present
+            data_table = WebDriverWait(driver, 10).until(
+                EC.presence_of_element_located(GRID_TABLE_LOC)
+            )
         print("Data table found.")
 
-        # Find all data rows for hourly consumption
-        # These rows have the class 'dxgvDataRow'
-        data_rows = data_table.find_elements(By.CLASS_NAME, "dxgvDataRow")
-        print(f"Found {len(data_rows)} hourly data rows.")
-
-        for row in data_rows:
-            cols = row.find_elements(By.TAG_NAME, "td")
-            if len(cols) == 2:
-                hour = cols[0].text
-                consumption = cols[1].text
-                hourly_data.append({"hour": hour, "consumption_kWh": consumption})
-            else:
-                print(f"Skipping row with unexpected number of columns: {row.text}")
-
-        # Find the footer row for total consumption
-        # This row has the id 'ASPxPageControl1_grid_DXFooterRow'
-        # It's inside a table with id 'ASPxPageControl1_grid_DXFooterTable'
-        footer_table = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.ID, "ASPxPageControl1_grid_DXFooterTable"))
+        # Fetch the table and its footer (id 'ASPxPageControl1_grid_DXFooterTable') in a
+        # single script call; both are rendered together, so no separate wait is needed
+        table_html, footer_html = driver.execute_script(
+            "const footer = document.getElementById('ASPxPageControl1_grid_DXFooterTable');"
+            "return [arguments[0].outerHTML, footer ? footer.outerHTML : null];",
+            data_table,
         )
-        footer_row = footer_table.find_element(By.ID, "ASPxPageControl1_grid_DXFooterRow")
-        if footer_row:
-            print("Footer row found.")
-            cols = footer_row.find_elements(By.TAG_NAME, "td")
-            if len(cols) == 2:
-                # The total consumption is in the second 'td'
-                # The text is like "Total units: 18.240"
-                total_consumption_text = cols[1].text
-                if "Total units:" in total_consumption_text:
-                    total_consumption = total_consumption_text.split(":")[-1].strip()
-            else:
-                print(f"Footer row has unexpected number of columns: {footer_row.text}")
+        hourly_data = parse_grid_rows(lxml.html.fromstring(table_html))
+
+        if footer_html:
+            total_consumption = parse_grid_total(lxml.html.fromstring(footer_html))
         else:
-            print("Footer row not found.")
+            print("Footer table not found.")
 
     except Exception as e:
         print(f"Error scraping data: {e}")
 
     return hourly_data, total_consumption
 
-# --- Configuration ---
-login_url = "https://www.usms.com.bn/SmartMeter/resLogin"
-
-# Load credentials from file
-username, password = load_credentials() # Loads USMS credentials from credentials.json by default
-
-if not username or not password:
-    print("Exiting script due to credential loading issues.")
-    exit()
+def capture_consumption_form(driver):
+    """
+    Captures the URL and form fields of the consumption page the driver is on,
+    so a later run can replay the same postback without a browser.
+    """
+    return driver.execute_script(
+        "const form = document.forms[0];"
+        "const fields = form ? Array.from(new FormData(form).entries()).filter(e => typeof e[1] === 'string') : [];"
+        "return {url: window.location.href, fields: fields};"
+    )
 
-# Path to your WebDriver executable (e.g., "chromedriver.exe" or "msedgedriver.exe")
-# If the WebDriver is in your system PATH or same directory as the script, you can just use its name.
-# webdriver_path = "chromedriver.exe" # Example for Chrome, adjust if needed or if it's in PATH
+def fetch_consumption_via_http(session, date_from, date_to):
+    """
+    Replays the consumption page 'Refresh' postback over plain HTTP using the
+    cookies and form fields saved by a previous browser run for the same date range.
+    Returns (hourly_data, total_consumption), or None if the session has expired
+    or the response carries no data, in which case the browser flow should be used.
+    """
+    form = (session or {}).get("consumption_forms", {}).get(f"{date_from}|{date_to}")
+    if not form or not form.get("url"):
+        return None
 
-# --- Element Locators (using NAME attribute from previous findings) ---
-username_field_name = "ASPxRoundPanel1$txtUsername"
-password_field_name = "ASPxRoundPanel1$txtPassword"
-login_button_name = "ASPxRoundPanel1$btnLogin" # This was in the form data
+    cookies = {c["name"]: c["value"] for c in session.get("cookies", [])}
+    try:
+        with httpx.Client(cookies=cookies, follow_redirects=True, timeout=20) as client:
+            print(f"Fetching consumption page over HTTP: {form['url']}")
+            page = client.get(form["url"])
+            if "reslogin" in str(page.url).lower():
+                print("Saved session has expired. Falling back to the browser.")
+                return None
+
+            # Reuse the saved control values but take fresh ASP.NET state from the page
+            fields = dict(form["fields"])
+            page_root = lxml.html.fromstring(page.text)
+            for name in ASPNET_STATE_FIELDS:
+                values = page_root.xpath(f"//input[@name='{name}']/@value")
+                if values:
+                    fields[name] = values[0]
+            fields["__EVENTTARGET"] = "btnRefresh"
+            fields["__EVENTARGUMENT"] = ""
+
+            response = client.post(form["url"], data=fields)
+            response.raise_for_status()
+
+        root = lxml.html.fromstring(response.text)
+        hourly_data = parse_grid_rows(root)
+        if not hourly_data:
+            print("HTTP response contained no consumption rows. Falling back to the browser.")
+            return None
+        return hourly_data, parse_grid_total(root)
+    except Exception as e:
+        print(f"Error fetching consumption data over HTTP: {e}")
+        return None
+
+def print_consumption(hourly_data, total_kwh):
+    if hourly_data:
+        print("\nHourly Consumption Data:")
+        for item in hourly_data:
+            print(f"  Hour: {item['hour']}, kWh: {item['consumption_kWh']}")
+    else:
+        print("\nNo hourly consumption data found or scraped.")
 
-# Initialize the WebDriver with headless mode
-chrome_options = Options()
-chrome_options.add_argument("--headless")
-chrome_options.add_argument("--window-size=1456,1020")
+    if total_kwh:
+        print(f"\nTotal Consumption: {total_kwh} kWh")
+    else:
+        print("\nCould not retrieve total consumption.")
 
-# Use the headless Chrome driver
-# driver = webdriver.Chrome(executable_path=webdriver_path, options=chrome_options) # Use this if webdriver_path is set
-driver = webdriver.Chrome(options=chrome_options)
-driver.set_window_size(1456, 1020) 
+def robust_click(driver, locator, timeout=15, attempts=3):
+    """
+    Waits for the element to be clickable, clicks it and returns it.
+    If an overlay intercepts the click, sends ESCAPE and retries with a short
+    exponential backoff, finally falling back to a JavaScript click.
+    """
+    element = WebDriverWait(driver, timeout).until(EC.element_to_be_clickable(locator))
+    for attempt in range(attempts):
+        try:
+            element.click()
+            return element
+        except ElementClickInterceptedException:
+            print(f"Click on {locator[1]} intercepted (attempt {attempt + 1}). Sending ESCAPE...")
+            driver.find_element(By.CSS_SELECTOR, 'body').send_keys(Keys.ESCAPE)
+            time.sleep(0.2 * (2 ** attempt))
+    print(f"Falling back to JavaScript click on {locator[1]}.")
+    driver.execute_script("arguments[0].click();", element)
+    return element
+
+def js_type(driver, element, text):
+    """
+    Replaces the element's value in one script call and fires the input/change
+    events the page's handlers listen for, instead of clear() plus send_keys().
+    """
+    driver.execute_script(
+        "arguments[0].value = arguments[1];"
+        "arguments[0].dispatchEvent(new Event('input', {bubbles: true}));"
+        "arguments[0].dispatchEvent(new Event('change', {bubbles: true}));",
+        element, text,
+    )
 
-print(f"Navigating to login page: {login_url}")
-driver.get(login_url)
+def login(driver, username, password, login_url):
+    """
+    Fills in the USMS login form and waits for the URL to change.
+    Raises TimeoutException if any step does not complete in time.
+    """
+    print(f"Navigating to login page: {login_url}")
+    driver.get(login_url)
 
-try:
     # Wait for the username field to be present and visible
     print("Waiting for username field (ID: ASPxRoundPanel1_txtUsername_I) to be clickable...")
-    username_input = WebDriverWait(driver, 20).until(
-        EC.element_to_be_clickable((By.ID, "ASPxRoundPanel1_txtUsername_I"))
-    )
-    username_input.click()
+    username_input = robust_click(driver, USERNAME_LOC, timeout=20)
     print("Username field clicked.")
-    username_input.send_keys(username)
+    js_type(driver, username_input, username)
     print("Username entered.")
 
     # Click to focus or dismiss pop-up after username, from test_meter3.py
     print("Clicking table cell (CSS: tr:nth-child(5) > td)...")
-    WebDriverWait(driver, 10).until(
-        EC.element_to_be_clickable((By.CSS_SELECTOR, "tr:nth-child(5) > td"))
-    ).click()
+    robust_click(driver, LOGIN_FOCUS_CELL_LOC, timeout=10)
     print("Table cell clicked.")
 
     # Find and fill the password field
     print("Waiting for password field (ID: ASPxRoundPanel1_txtPassword_I) to be clickable...")
-    password_input = WebDriverWait(driver, 10).until(
-        EC.element_to_be_clickable((By.ID, "ASPxRoundPanel1_txtPassword_I"))
-    )
-    password_input.click()
+    password_input = robust_click(driver, PASSWORD_LOC, timeout=10)
     print("Password field clicked.")
-    password_input.send_keys(password)
+    js_type(driver, password_input, password)
     print("Password entered.")
 
     # Find and click the login button
     print("Waiting for login button (CSS: #ASPxRoundPanel1_btnLogin_CD > .dx-vam) to be clickable...")
     login_button = WebDriverWait(driver, 20).until(
-        EC.element_to_be_clickable((By.CSS_SELECTOR, "#ASPxRoundPanel1_btnLogin_CD > .dx-vam"))
+        EC.element_to_be_clickable(LOGIN_BTN_LOC)
     )
     print("Login button is clickable. Attempting to click...")
     driver.execute_script("arguments[0].scrollIntoView({behavior: 'auto', block: 'center', inline: 'center'});", login_button)
-    time.sleep(0.5)
     login_button.click()
     print("Login button clicked.")
 
     print("Waiting up to 10 seconds for URL to change after login...")
     WebDriverWait(driver, 10).until(EC.url_changes(login_url))
 
-    current_url = driver.current_url
-    print(f"Current URL after login attempt: {current_url}")
+def load_session():
+    """Returns the session saved by a previous run, or None."""
+    try:
+        with open(SESSION_FILE, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
 
-    if "reslogin" not in current_url.lower():
-        print("Login successful! URL has changed.")
-        print(f"Now on page: {driver.current_url}")
-        
-        print("Allowing MainPage to settle for 3 seconds...")
-        time.sleep(3)
+def save_session(driver, consumption_form=None, date_from=None, date_to=None):
+    """
+    Remembers the post-login URL and cookies so the next run can skip the login form.
+    If consumption_form is given it is stored, keyed by its date range, enabling the HTTP fast path.
+    """
+    url = driver.current_url
+    cookies = driver.get_cookies()
+    with SESSION_LOCK:
+        session = load_session() or {}
+        session["url"] = url
+        session["cookies"] = cookies
+        if consumption_form:
+            session.setdefault("consumption_forms", {})[f"{date_from}|{date_to}"] = consumption_form
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            # The file holds live session cookies, so keep it readable by the owner only
+            with os.fdopen(os.open(SESSION_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as f:
+                os.chmod(SESSION_FILE, 0o600)
+                json.dump(session, f)
+        except Exception as e:
+            print(f"Could not save session: {e}")
+
+def restore_session(driver, session):
+    """
+    Tries to reach the last post-login page without logging in, first relying on
+    the persistent Chrome profile and then by replaying the saved cookies.
+    Returns True if the session is still valid.
+    """
+    if not session:
+        return False
+
+    session_url = session.get("url")
+    if not session_url:
+        return False
+
+    print(f"Trying to reuse previous session: {session_url}")
+    driver.get(session_url)
+    if "reslogin" not in driver.current_url.lower():
+        print("Session restored from Chrome profile.")
+        return True
 
+    # The profile did not carry the session (e.g. it was wiped); fall back to saved cookies
+    for cookie in session.get("cookies", []):
         try:
-            print("Switching to iframe (index 0)...")
-            WebDriverWait(driver, 20).until(EC.frame_to_be_available_and_switch_to_it(0))
-            print("Switched to iframe.")
-            time.sleep(1)
-
-            print("Waiting for consumption image link (CSS: #ASPxCardView1_DXCardLayout0_cell0_18_ASPxHyperLink4_0 > img)...")
-            consumption_link_img = WebDriverWait(driver, 30).until(
-                EC.element_to_be_clickable((By.CSS_SELECTOR, "#ASPxCardView1_DXCardLayout0_cell0_18_ASPxHyperLink4_0 > img"))
-            )
-            print("Consumption image link found. Clicking...")
-            consumption_link_img.click()
-            print("Consumption image link clicked.")
-            time.sleep(3)
-
-            print("Waiting for 'Type' dropdown (ID: cboType_I)...")
-            type_dropdown = WebDriverWait(driver, 20).until(EC.element_to_be_clickable((By.ID, "cboType_I")))
-            type_dropdown.click()
-            print("'Type' dropdown clicked.")
-            time.sleep(1)
-
-            print("Waiting for 'Type' option (ID: cboType_DDD_L_LBI3T0)...")
-            type_option = WebDriverWait(driver, 10).until(EC.element_to_be_clickable((By.ID, "cboType_DDD_L_LBI3T0")))
-            type_option.click()
-            print("'Type' option selected.")
-            time.sleep(1)
-
-            print("Interacting with 'Date From' (ID: cboDateFrom_I)...")
-            date_from_input = WebDriverWait(driver, 10).until(EC.element_to_be_clickable((By.ID, "cboDateFrom_I")))
-            date_from_input.click()
-            time.sleep(0.5)
-            date_from_input.click()
-            time.sleep(0.5)
-            
-            print("Clicking to close calendar/focus (CSS: #UpdatePanel1 > div > table > tbody > tr:nth-child(3))...")
-            WebDriverWait(driver, 10).until(
-                EC.element_to_be_clickable((By.CSS_SELECTOR, "#UpdatePanel1 > div > table > tbody > tr:nth-child(3)"))
-            ).click()
-            time.sleep(0.5)
-
-            print("Sending keys '29-5-25' to 'Date From'...")
-            date_from_input.clear()
-            date_from_input.send_keys("29-5-25")
-            print("'Date From' set.")
-            time.sleep(1)
-
-            # Interact with "Date To"
-            print("Interacting with 'Date To' (ID: cboDateTo_I)...")
-            
-            # Explicitly wait for the known overlay to be gone before interacting with date input
-            overlay_id = "pcErr_DXPWMB-1"
-            print(f"Checking for overlay {overlay_id} and waiting for it to be invisible...")
+            driver.add_cookie(cookie)
+        except Exception:
+            pass
+    driver.get(session_url)
+    if "reslogin" not in driver.current_url.lower():
+        print("Session restored from saved cookies.")
+        return True
+
+    print("Previous session has expired. Logging in again.")
+    return False
+
+def build_chrome_options(profile_dir):
+    """Headless Chrome options using the given persistent profile directory."""
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")
+    chrome_options.add_argument("--window-size=1456,1020")
+    chrome_options.add_argument(f"--user-data-dir={profile_dir}")
+    # The DevExpress scripts and styles are the bulk of each page; let the profile's cache keep them
+    chrome_options.add_argument("--disk-cache-size=134217728")
+    # Only the grid markup is needed, so skip images and subsystems a headless run never uses
+    chrome_options.add_argument("--blink-settings=imagesEnabled=false")
+    chrome_options.add_argument("--disable-extensions")
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--mute-audio")
+    chrome_options.add_argument("--disable-background-timer-throttling")
+    chrome_options.add_argument("--disable-renderer-backgrounding")
+    # Keep per-instance memory low so several workers can run side by side on a small host.
+    # --single-process is deliberately not used; it breaks pages on some sites.
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument("--disable-background-networking")
+    chrome_options.add_argument("--disable-sync")
+    chrome_options.add_argument("--disable-default-apps")
+    chrome_options.add_argument("--disable-features=Translate,BackForwardCache,MediaRouter")
+    chrome_options.add_argument("--metrics-recording-only")
+    chrome_options.add_argument("--no-first-run")
+    chrome_options.add_argument("--js-flags=--max-old-space-size=256")
+    chrome_options.add_argument("--renderer-process-limit=2")
+    chrome_options.add_experimental_option("prefs", {
+        "profile.managed_default_content_settings.images": 2,
+        "profile.default_content_setting_values.notifications": 2,
+    })
+    # Return from driver.get() at DOMContentLoaded; every step after it uses explicit waits
+    chrome_options.page_load_strategy = 'eager'
+    return chrome_options
+
+def scrape_range(date_from, date_to, username, password):
+    """
+    Runs the full scrape for one date range in its own headless Chrome instance.
+    Returns (hourly_data, total_kwh). Safe to call from several threads at once.
+    """
+    hourly_data, total_kwh = [], None
+
+    # Try the browserless fast path first; it only works once a browser run has saved a session
+    saved_session = load_session()
+    http_result = fetch_consumption_via_http(saved_session, date_from, date_to)
+    if http_result:
+        return http_result
+
+    # Each concurrent Chrome needs its own profile directory; borrow one from the pool
+    profile_slot = PROFILE_SLOTS.get()
+    try:
+        # Use the headless Chrome driver
+        driver = webdriver.Chrome(options=build_chrome_options(os.path.join(PROFILE_DIR, f"chrome-{profile_slot}")))
+    except Exception:
+        PROFILE_SLOTS.put(profile_slot)
+        raise
+    driver.set_window_size(1456, 1020)
+
+    try:
+        if not restore_session(driver, saved_session):
+            login(driver, username, password, login_url)
+
+        current_url = driver.current_url
+        print(f"Current URL after login attempt: {current_url}")
+
+        if "reslogin" not in current_url.lower():
+            print("Login successful! URL has changed.")
+            print(f"Now on page: {driver.current_url}")
+            save_session(driver)
+
             try:
-                WebDriverWait(driver, 15).until( # Increased wait time slightly
-                    EC.invisibility_of_element_located((By.ID, overlay_id))
+                # The frame wait below returns as soon as MainPage has rendered the iframe
+                print("Switching to iframe (index 0)...")
+                WebDriverWait(driver, 20).until(EC.frame_to_be_available_and_switch_to_it(0))
+                print("Switched to iframe.")
+
+                print("Waiting for consumption image link (CSS: #ASPxCardView1_DXCardLayout0_cell0_18_ASPxHyperLink4_0 > img)...")
+                consumption_link_img = WebDriverWait(driver, 30).until(
+                    EC.element_to_be_clickable(CONSUMPTION_LINK_LOC)
+                )
+                print("Consumption image link found. Clicking...")
+                old_document = driver.find_element(By.CSS_SELECTOR, "html")
+                consumption_link_img.click()
+                print("Consumption image link clicked.")
+                WebDriverWait(driver, 15).until(EC.staleness_of(old_document))
+
+                print("Waiting for 'Type' dropdown (ID: cboType_I)...")
+                robust_click(driver, TYPE_DD_LOC, timeout=20)
+                print("'Type' dropdown clicked.")
+
+                print("Waiting for 'Type' option (ID: cboType_DDD_L_LBI3T0)...")
+                robust_click(driver, TYPE_OPTION_LOC, timeout=10)
+                print("'Type' option selected.")
+                WebDriverWait(driver, 10).until(EC.invisibility_of_element_located(TYPE_OPTION_LOC))
+                WebDriverWait(driver, 10).until(page_is_idle)
+
+                print("Interacting with 'Date From' (ID: cboDateFrom_I)...")
+                date_from_input = robust_click(driver, DATE_FROM_LOC, timeout=10)
+                date_from_input.click()
+
+                print("Clicking to close calendar/focus (CSS: #UpdatePanel1 > div > table > tbody > tr:nth-child(3))...")
+                robust_click(driver, DATE_FROM_CLOSE_LOC, timeout=10)
+
+                # The date edits parse typed keys client-side, so these keep using send_keys
+                print(f"Sending keys '{date_from}' to 'Date From'...")
+                date_from_input.clear()
+                date_from_input.send_keys(date_from)
+                print("'Date From' set.")
+
+                # Interact with "Date To"
+                print("Interacting with 'Date To' (ID: cboDateTo_I)...")
+            
+                # The error popup (pcErr_DXPWMB-1) can sit over the date input; robust_click dismisses it
+                print("Attempting to click 'Date To' input field...")
+                robust_click(driver, DATE_TO_LOC, timeout=10)
+                print("'Date To' input field clicked.")
+
+                print("Clicking related to date picker (CSS: tr:nth-child(3) > td > table > tbody > tr)...")
+                robust_click(driver, DATE_TO_CLOSE_LOC, timeout=10)
+                print("Clicked element related to date picker.")
+
+                # Re-fetch element before send_keys for robustness
+                print("Re-fetching 'Date To' input element before sending keys...")
+                date_to_input = WebDriverWait(driver, 10).until(EC.presence_of_element_located(DATE_TO_LOC))
+                print(f"Sending keys '{date_to}' to 'Date To'...")
+                date_to_input.clear()
+                date_to_input.send_keys(date_to)
+                print("'Date To' set.")
+
+                print("Waiting for 'Refresh' button (CSS: #btnRefresh_CD > .dx-vam)...")
+                robust_click(driver, REFRESH_BTN_LOC, timeout=20)
+                print("'Refresh' button clicked.")
+                WebDriverWait(driver, 20).until(page_is_idle)
+
+                print("Waiting for 'Hourly Consumption' tab (CSS: #ASPxPageControl1_T1T > .dx-vam)...")
+                robust_click(driver, HOURLY_TAB_LOC, timeout=20)
+                print("'Hourly Consumption' tab clicked.")
+                data_table = WebDriverWait(driver, 20).until(
+                    EC.presence_of_element_located(GRID_TABLE_LOC)
                 )
-                print(f"Overlay {overlay_id} is invisible or gone.")
-            except TimeoutException:
-                print(f"Overlay {overlay_id} did not disappear. Attempting to send ESCAPE key...")
-                try:
-                    driver.find_element(By.TAG_NAME, 'body').send_keys(Keys.ESCAPE)
-                    print("Sent ESCAPE key.")
-                    time.sleep(1) # Give it a moment to react
-                except Exception as esc_e:
-                    print(f"Could not send ESCAPE key: {esc_e}")
-
-            # Now, attempt to click the date input field
-            date_to_input = WebDriverWait(driver, 10).until(EC.element_to_be_clickable((By.ID, "cboDateTo_I")))
-            print("Attempting to click 'Date To' input field...")
-            try:
-                date_to_input.click()
-                print("'Date To' input field clicked normally.")
-            except Exception as e:
-                print(f"Normal click on 'Date To' failed: {type(e).__name__} - {e}. Attempting JavaScript click.")
-                driver.execute_script("arguments[0].click();", date_to_input)
-                print("'Date To' input field clicked using JavaScript.")
-            time.sleep(0.5)
-
-            print("Clicking related to date picker (CSS: tr:nth-child(3) > td > table > tbody > tr)...")
-            WebDriverWait(driver, 10).until(
-                 EC.element_to_be_clickable((By.CSS_SELECTOR, "tr:nth-child(3) > td > table > tbody > tr"))
-            ).click()
-            print("Clicked element related to date picker.")
-            time.sleep(0.5)
-
-            # Re-fetch element before send_keys for robustness
-            print("Re-fetching 'Date To' input element before sending keys...")
-            date_to_input = WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.ID, "cboDateTo_I")))
-            print("Sending keys '29-5-25' to 'Date To'...")
-            date_to_input.clear()
-            date_to_input.send_keys("29-5-25")
-            print("'Date To' set.")
-            time.sleep(1)
-
-            print("Waiting for 'Refresh' button (CSS: #btnRefresh_CD > .dx-vam)...")
-            refresh_button = WebDriverWait(driver, 20).until(
-                EC.element_to_be_clickable((By.CSS_SELECTOR, "#btnRefresh_CD > .dx-vam"))
-            )
-            refresh_button.click()
-            print("'Refresh' button clicked.")
-            time.sleep(5)
 
-            print("Waiting for 'Hourly Consumption' tab (CSS: #ASPxPageControl1_T1T > .dx-vam)...")
-            hourly_tab = WebDriverWait(driver, 20).until(
-                EC.element_to_be_clickable((By.CSS_SELECTOR, "#ASPxPageControl1_T1T > .dx-vam"))
-            )
-            hourly_tab.click()
-            print("'Hourly Consumption' tab clicked.")
-            time.sleep(5)
+                print(f"Current URL after navigation: {driver.current_url}")
+                print(f"Page title after navigation: {driver.title}")
 
-            print(f"Current URL after navigation: {driver.current_url}")
-            print(f"Page title after navigation: {driver.title}")
+                print("Attempting to scrape data from the table...")
+                hourly_data, total_kwh = scrape_data_from_table(driver, data_table)
 
-            print("Attempting to scrape data from the table...")
-            hourly_data, total_kwh = scrape_data_from_table(driver)
+                if hourly_data:
+                    # Remember how this page was reached so the next run can replay it over HTTP
+                    save_session(driver, capture_consumption_form(driver), date_from, date_to)
 
-            if hourly_data:
-                print("\nHourly Consumption Data:")
-                for item in hourly_data:
-                    print(f"  Hour: {item['hour']}, kWh: {item['consumption_kWh']}")
-            else:
-                print("\nNo hourly consumption data found or scraped.")
+            except TimeoutException as nav_te:
+                print(f"Timeout during post-login navigation: {nav_te}")
+            except Exception as nav_e:
+                print(f"An error occurred during post-login navigation or scraping: {nav_e}")
+            # ==============================================================================
 
-            if total_kwh:
-                print(f"\nTotal Consumption: {total_kwh} kWh")
+        else:
+            # Fetch the page source once and check it for both failure markers
+            page_source = driver.page_source
+            if "Invalid IC Number or Password" in page_source:
+                print("Login failed: Invalid IC Number or Password message found on page.")
+            elif username_field_name in page_source: # Check if login fields are still present
+                print("Login failed: Still on the login page (login fields detected).")
             else:
-                print("\nCould not retrieve total consumption.")
-            
-        except TimeoutException as nav_te:
-            print(f"Timeout during post-login navigation: {nav_te}")
-        except Exception as nav_e:
-            print(f"An error occurred during post-login navigation or scraping: {nav_e}")
-        # ==============================================================================
-
-    elif "Invalid IC Number or Password" in driver.page_source:
-        print("Login failed: Invalid IC Number or Password message found on page.")
-    elif username_field_name in driver.page_source: # Check if login fields are still present
-        print("Login failed: Still on the login page (login fields detected).")
-    else:
-        print("Login status uncertain. Please check the browser window and console output.")
-        print("Page title:", driver.title)
+                print("Login status uncertain. Please check the browser window and console output.")
+                print("Page title:", driver.title)
+
+        print("Script finished checks. Browser will close shortly.")
 
-    print("Script finished checks. Browser will close shortly.")
+    except TimeoutException as te: # Catch TimeoutException specifically
+        print(f"A timeout occurred during an explicit wait: {te}")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+    finally:
+        print("Closing the browser.")
+        driver.quit()
+        PROFILE_SLOTS.put(profile_slot)
+
+    return hourly_data, total_kwh
+
+# --- Configuration ---
+login_url = "https://www.usms.com.bn/SmartMeter/resLogin"
 
-except TimeoutException as te: # Catch TimeoutException specifically
-    print(f"A timeout occurred during an explicit wait: {te}")
-except Exception as e:
-    print(f"An error occurred: {e}")
+# Date ranges to scrape, as (date_from, date_to) in the site's d-m-yy format.
+# Each range runs in its own headless Chrome; keep MAX_WORKERS small to avoid tripping anti-bot checks.
+DATE_RANGES = [("29-5-25", "29-5-25")]
+MAX_WORKERS = 4
+
+# Persistent Chrome profiles so cookies survive between runs.
+# Every worker gets its own profile because Chrome locks a profile while in use.
+PROFILE_DIR = os.path.join(os.path.expanduser("~"), ".emscraper_profile")
+SESSION_FILE = os.path.join(PROFILE_DIR, "usms_session.json")
+SESSION_LOCK = threading.Lock()
+PROFILE_SLOTS = queue.Queue()
+for _slot in range(MAX_WORKERS):
+    PROFILE_SLOTS.put(_slot)
+
+# Hidden ASP.NET fields that must be fresh for a postback to be accepted
+ASPNET_STATE_FIELDS = ("__VIEWSTATE", "__VIEWSTATEGENERATOR", "__EVENTVALIDATION")
+
+# --- Element Locators (using NAME attribute from previous findings) ---
+username_field_name = "ASPxRoundPanel1$txtUsername"
+password_field_name = "ASPxRoundPanel1$txtPassword"
+login_button_name = "ASPxRoundPanel1$btnLogin" # This was in the form data
+
+# Locators for the login and consumption pages
+GRID_TABLE_LOC = (By.CSS_SELECTOR, "#ASPxPageControl1_grid_DXMainTable")
+USERNAME_LOC = (By.CSS_SELECTOR, "#ASPxRoundPanel1_txtUsername_I")
+LOGIN_FOCUS_CELL_LOC = (By.CSS_SELECTOR, "tr:nth-child(5) > td")
+PASSWORD_LOC = (By.CSS_SELECTOR, "#ASPxRoundPanel1_txtPassword_I")
+LOGIN_BTN_LOC = (By.CSS_SELECTOR, "#ASPxRoundPanel1_btnLogin_CD > .dx-vam")
+CONSUMPTION_LINK_LOC = (By.CSS_SELECTOR, "#ASPxCardView1_DXCardLayout0_cell0_18_ASPxHyperLink4_0 > img")
+TYPE_DD_LOC = (By.CSS_SELECTOR, "#cboType_I")
+TYPE_OPTION_LOC = (By.CSS_SELECTOR, "#cboType_DDD_L_LBI3T0")
+DATE_FROM_LOC = (By.CSS_SELECTOR, "#cboDateFrom_I")
+DATE_FROM_CLOSE_LOC = (By.CSS_SELECTOR, "#UpdatePanel1 > div > table > tbody > tr:nth-child(3)")
+DATE_TO_LOC = (By.CSS_SELECTOR, "#cboDateTo_I")
+DATE_TO_CLOSE_LOC = (By.CSS_SELECTOR, "tr:nth-child(3) > td > table > tbody > tr")
+REFRESH_BTN_LOC = (By.CSS_SELECTOR, "#btnRefresh_CD > .dx-vam")
+HOURLY_TAB_LOC = (By.CSS_SELECTOR, "#ASPxPageControl1_T1T > .dx-vam")
+
+def main():
+    # Load credentials from file once, outside the worker pool
+    username, password = load_credentials() # Loads USMS credentials from credentials.json by default
+
+    if not username or not password:
+        print("Exiting script due to credential loading issues.")
+        raise SystemExit(1)
+
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(DATE_RANGES))) as executor:
+        futures = {
+            executor.submit(scrape_range, date_from, date_to, username, password): (date_from, date_to)
+            for date_from, date_to in DATE_RANGES
+        }
+        for future in as_completed(futures):
+            date_from, date_to = futures[future]
+            print(f"\n===== Results for {date_from} to {date_to} =====")
+            try:
+                hourly_data, total_kwh = future.result()
+                print_consumption(hourly_data, total_kwh)
+            except Exception as e:
+                print(f"Scrape for {date_from} to {date_to} failed: {e}")
 
-finally:
-    print("Closing the browser.")
-    driver.quit()
+if __name__ == "__main__":
+    main()
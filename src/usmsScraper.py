@@ -1,528 +1,630 @@
-from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException
-import json # Added for loading credentials
-import time
-from mqtt_publisher import publish_usms_json # Added for MQTT publishing
-import os # Added
+import lxml.html
+from mqtt_publisher import publish_usms_json, set_client_suffix, close_client # Added for MQTT publishing
 from datetime import datetime, timezone, timedelta # Added timezone, timedelta
-from excel_exporter import export_usms_data
-
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options # Added
-from webdriver_manager.chrome import ChromeDriverManager
-
-# Function to load credentials from a JSON file
-def load_credentials(file_path=None, service="USMS"):
-    if file_path is None:
-        # Get the directory where this script is located
-        import os
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        file_path = os.path.join(script_dir, "credentials.json")
-    try:
-        with open(file_path, 'r') as f:
-            creds = json.load(f)
-            # Check if the service exists in the credentials
-            if service not in creds:
-                print(f"Error: Service '{service}' not found in '{file_path}'.")
-                return None, None
-            
-            service_creds = creds[service]
-            # Return username and password for USMS, or serviceNumber and accountNumber for other services
-            if service == "USMS":
-                return service_creds.get("username"), service_creds.get("password")
-            elif service == "Imagine":
-                return service_creds.get("serviceNumber"), service_creds.get("accountNumber")
-            else:
-                # For future services, you can add more conditions here
-                print(f"Error: Unknown service '{service}'.")
-                return None, None
-    except FileNotFoundError:
-        print(f"Error: Credentials file '{file_path}' not found.")
-        return None, None
-    except json.JSONDecodeError:
-        print(f"Error: Could not decode JSON from '{file_path}'.")
-        return None, None
-    except KeyError as e:
-        print(f"Error: Required key not found in '{file_path}': {e}")
-        return None, None
+from excel_exporter import export_usms_data, export_batch, prepare_usms_sheets
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import logging
+import hashlib
+import os
+import threading
+import time
+
+from scraper_common import (load_all_credentials, setup_driver, parse_grid_rows, parse_grid_total, page_is_idle, wait,
+                            build_usms_chrome_options, submit_usms_login, find_meter_cards, read_meter_fields,
+                            METER_FIELDS)
+
+log = logging.getLogger(__name__)
 
 def scrape_data_from_table(driver):
+    """
+    Scrapes hourly and total consumption data from the consumption grid.
+    The grid's markup, footer included, is fetched in one script call and parsed
+    locally with lxml, so the number of WebDriver round-trips does not grow with
+    the number of rows.
+    """
     hourly_data = []
     total_consumption = None
 
     try:
-        # Wait for the main data table to be present
-        data_table = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.ID, "ASPxPageControl1_grid_DXMainTable"))
+        # Wait for the grid; its data table and footer table are rendered inside it together
+        grid = wait(driver, WAIT).until(
+            EC.presence_of_element_located(GRID_LOC)
         )
-        print("Data table found.")
-
-        # Find all data rows for hourly consumption
-        # These rows have the class 'dxgvDataRow'
-        data_rows = data_table.find_elements(By.CLASS_NAME, "dxgvDataRow")
-        print(f"Found {len(data_rows)} hourly data rows.")
-
-        for row in data_rows:
-            cols = row.find_elements(By.TAG_NAME, "td")
-            if len(cols) == 2:
-                hour = cols[0].text
-                consumption = cols[1].text
-                hourly_data.append({"hour": hour, "consumption_kWh": consumption})
-            else:
-                print(f"Skipping row with unexpected number of columns: {row.text}")
+        log.debug("Data grid found.")
 
-        # Find the footer row for total consumption
-        # This row has the id 'ASPxPageControl1_grid_DXFooterRow'
-        # It's inside a table with id 'ASPxPageControl1_grid_DXFooterTable'
-        footer_table = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.ID, "ASPxPageControl1_grid_DXFooterTable"))
-        )
-        footer_row = footer_table.find_element(By.ID, "ASPxPageControl1_grid_DXFooterRow")
-        if footer_row:
-            print("Footer row found.")
-            cols = footer_row.find_elements(By.TAG_NAME, "td")
-            if len(cols) == 2:
-                # The total consumption is in the second 'td'
-                # The text is like "Total units: 18.240"
-                total_consumption_text = cols[1].text
-                if "Total units:" in total_consumption_text:
-                    total_consumption = total_consumption_text.split(":")[-1].strip()
-            else:
-                print(f"Footer row has unexpected number of columns: {footer_row.text}")
-        else:
-            print("Footer row not found.")
+        grid_root = lxml.html.fromstring(driver.execute_script("return arguments[0].outerHTML;", grid))
+        hourly_data = parse_grid_rows(grid_root)
+        total_consumption = parse_grid_total(grid_root)
 
     except Exception as e:
-        print(f"Error scraping data: {e}")
+        log.error(f"Error scraping data: {e}")
 
     return hourly_data, total_consumption
 
 def scrape_meter_data(driver, meter_index):
     """
     Scrapes data from a specific meter (electricity=0, water=1).
-    Collects all available fields for both meter types.
+    Collects all available fields for both meter types in one script call.
     """
     meter_data = {}
     meter_type = "Electricity" if meter_index == 0 else "Water"
     
     try:
-        # Define the selectors for this specific meter
-        base_id = f"ASPxCardView1_DXCardLayout{meter_index}"
-        
-        # Collect all fields for both meter types
-        fields = {
-            "Meter No": f"#{base_id}_2 .dxflNestedControlCell",
-            "Full Name": f"#{base_id}_4 .dxflNestedControlCell", 
-            "Meter Status": f"#{base_id}_5 .dxflNestedControlCell",
-            "Address": f"#{base_id}_6 .dxflNestedControlCell",
-            "Kampong": f"#{base_id}_7 .dxflNestedControlCell",
-            "Mukim": f"#{base_id}_8 .dxflNestedControlCell",
-            "District": f"#{base_id}_9 .dxflNestedControlCell",
-            "Postcode": f"#{base_id}_10 .dxflNestedControlCell",
-            "Remaining Unit": f"#{base_id}_11 .dxflNestedControlCell",
-            "Remaining Balance": f"#{base_id}_12 .dxflNestedControlCell",
-            "Last Updated": f"#{base_id}_17 .dxflNestedControlCell"
-        }
+        # Selectors for this specific meter, built once at import
+        fields = METER_FIELDS[meter_index]
 
-        print(f"\nScraping {meter_type} meter data...")
-        
-        for field_name, css_selector in fields.items():
-            try:
-                element = WebDriverWait(driver, 10).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, css_selector))
-                )
-                meter_data[field_name] = element.text.strip()
-                print(f"  {field_name}: {element.text.strip()}")
-            except TimeoutException:
-                print(f"  Error: Timed out waiting for {field_name} to load.")
-                meter_data[field_name] = None
-            except Exception as e:
-                print(f"  Error getting {field_name}: {e}")
-                meter_data[field_name] = None
+        log.debug(f"\nScraping {meter_type} meter data...")
+
+        # The card renders all its fields together, so wait for the first one and
+        # then read every field in a single script call
+        first_selector = next(iter(fields.values()))
+        try:
+            wait(driver, WAIT).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, first_selector))
+            )
+        except TimeoutException:
+            # The fields render together, so the rest are missing too; don't read a card that isn't there
+            log.warning(f"  Error: Timed out waiting for {meter_type} meter fields to load.")
+            return meter_data
+
+        values = read_meter_fields(driver, meter_index)
+
+        for field_name in fields:
+            meter_data[field_name] = values.get(field_name)
+            if meter_data[field_name] is None:
+                log.warning(f"  Error: {field_name} not found.")
+            else:
+                log.debug(f"  {field_name}: {meter_data[field_name]}")
                 
         # Add meter type for identification
         meter_data["Meter Type"] = meter_type
         
     except Exception as e:
-        print(f"Error scraping {meter_type} meter data: {e}")
+        log.error(f"Error scraping {meter_type} meter data: {e}")
         
     return meter_data
 
-def scrape_all_meters(driver):
+class FrameCtx:
+    """
+    Tracks whether the driver is switched into a frame, so leaving is a no-op
+    when it isn't.
+    """
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.in_frame = False
+
+    def enter(self, frame_locator, timeout=None):
+        # Frames are entered from the top-level document
+        self.leave()
+        wait(self.driver, timeout or WAIT).until(EC.frame_to_be_available_and_switch_to_it(frame_locator))
+        self.in_frame = True
+
+    def leave(self):
+        if self.in_frame:
+            self.driver.switch_to.default_content()
+            self.in_frame = False
+
+def scrape_all_meters(driver, frames):
     """
     Scrapes data from all available meters on the page.
     Returns a dictionary with electricity and water meter data.
+    Leaves the driver in 'MyFrame', which also holds the consumption link;
+    the caller's frames.leave() switches back.
     """
     all_meters = {}
     
     try:
         # Switch to the iframe 'MyFrame' using its ID
-        try:
-            driver.switch_to.default_content()
-            print("Switched to default content before attempting to switch to MyFrame.")
-        except Exception:
-            pass
+        frames.enter(MY_FRAME_LOC)
+        log.debug("Switched to iframe 'MyFrame'.")
 
-        WebDriverWait(driver, 10).until(EC.frame_to_be_available_and_switch_to_it((By.ID, "MyFrame")))
-        print("Switched to iframe 'MyFrame'.")
-
-        # Check which meters are available by looking for their card elements
+        # Check which meters are available by looking for their card elements, both in one call
         available_meters = []
-          # Check for electricity meter (index 0)
-        try:
-            driver.find_element(By.ID, "ASPxCardView1_DXDataCard0")
-            available_meters.append((0, "Electricity"))
-            print("Electricity meter found.")
-        except Exception:
-            print("Electricity meter not found.")
-            
-        # Check for water meter (index 1) 
-        try:
-            driver.find_element(By.ID, "ASPxCardView1_DXDataCard1")
-            available_meters.append((1, "Water"))
-            print("Water meter found.")
-        except Exception:
-            print("Water meter not found.")
-              # Scrape data from each available meter
+        for meter_index, meter_name, found in find_meter_cards(driver):
+            if found:
+                available_meters.append((meter_index, meter_name))
+                log.debug(f"{meter_name} meter found.")
+            else:
+                log.warning(f"{meter_name} meter not found.")
+        # Scrape data from each available meter, stamping them all with one execution time
+        scrape_time = datetime.now(BRUNEI_TZ).isoformat()
         for meter_index, meter_name in available_meters:
             meter_data = scrape_meter_data(driver, meter_index)
             # Add script execution timestamp to each meter
             if meter_data:
-                utc_now = datetime.now(timezone.utc)
-                brunei_tz = timezone(timedelta(hours=8))
-                brunei_now = utc_now.astimezone(brunei_tz)
-                meter_data['Script Execution Time'] = brunei_now.isoformat()
+                meter_data['Script Execution Time'] = scrape_time
             all_meters[meter_name.lower()] = meter_data
 
-        # Switch back to the default content after scraping
-        driver.switch_to.default_content()
-        print("Switched back to default content from MyFrame.")
-
     except Exception as e:
-        print(f"Error scraping meter data: {e}")
-        try:
-            driver.switch_to.default_content()
-            print("Switched back to default content after error in meter data scraping.")
-        except Exception:
-            pass
+        log.error(f"Error scraping meter data: {e}")
             
     return all_meters
 
-def setup_driver():
-    """Initializes and returns a Chrome WebDriver instance."""
-    options = Options()
-    chrome_exe_paths_to_try = [
-        r"C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe",
-        r"C:\\Program Files (x86)\\Google\\Chrome\\Application\\chrome.exe",
-        rf"C:\\Users\\{os.getlogin()}\\AppData\\Local\\Google\\Chrome\\Application\\chrome.exe"
-    ]
-    found_chrome_binary = False
-    for path_option in chrome_exe_paths_to_try:
-        if os.path.exists(path_option):
-            options.binary_location = path_option
-            print(f"Using Chrome binary location: {path_option}")
-            found_chrome_binary = True
-            break
-    if not found_chrome_binary:
-        print("WARNING: Chrome binary not found at common locations. Selenium will try to locate it automatically.")
-        print(f"Looked in: {chrome_exe_paths_to_try}")
-
-    try:
-        raw_driver_path = ChromeDriverManager().install()
-        print(f"Raw ChromeDriver Path from WDM: {raw_driver_path}")
-    except Exception as e:
-        print(f"Error calling ChromeDriverManager().install(): {e}")
-        print("Please ensure webdriver-manager is installed and can access the internet.")
-        return None
-
-    normalized_driver_path = os.path.normpath(raw_driver_path)
-    
-    # Try to find chromedriver.exe
-    # Path 1: In the same directory as the file WDM pointed to (e.g., .../chromedriver-win32/chromedriver.exe)
-    potential_path1 = os.path.join(os.path.dirname(normalized_driver_path), "chromedriver.exe")
-    # Path 2: In the parent directory of where WDM pointed (e.g., .../137.0.7151.68/chromedriver.exe)
-    potential_path2 = os.path.join(os.path.dirname(os.path.dirname(normalized_driver_path)), "chromedriver.exe")
-
-    corrected_driver_path = None
-    if os.path.exists(potential_path1):
-        corrected_driver_path = potential_path1
-        print(f"Found ChromeDriver at: {corrected_driver_path}")
-    elif os.path.exists(potential_path2):
-        corrected_driver_path = potential_path2
-        print(f"Found ChromeDriver at: {corrected_driver_path}")
-    else:
-        print(f"Initial path from WDM: {normalized_driver_path}")
-        print(f"Checked for ChromeDriver at: {potential_path1}")
-        print(f"Checked for ChromeDriver at: {potential_path2}")
-        print("ERROR: ChromeDriver executable not found at expected locations within .wdm cache.")
-        print("Please check the .wdm cache structure or webdriver-manager installation.")
-        return None
-
-    print(f"Using final ChromeDriver Path: {corrected_driver_path}")
-    
-    try:
-        driver_service = Service(executable_path=corrected_driver_path)
-        driver = webdriver.Chrome(service=driver_service, options=options)
-        return driver
-    except Exception as e:
-        print(f"Error initializing webdriver.Chrome with path {corrected_driver_path}: {e}")
-        return None
+def profile_dir_for(username):
+    """
+    Persistent Chrome profile for one account. Keyed on the account rather than a
+    worker slot, so the cookies a profile keeps always belong to the same login.
+    """
+    return os.path.join(PROFILE_DIR, hashlib.sha256(username.encode("utf-8")).hexdigest()[:16])
 
 # --- Configuration ---
 login_url = "https://www.usms.com.bn/SmartMeter/resLogin"
-
-# Load credentials from file
-username, password = load_credentials() # Loads USMS credentials from credentials.json by default
-
-if not username or not password:
-    print("Exiting script due to credential loading issues.")
-    exit()
+# Accounts are scraped in parallel, each in its own browser; the work is almost all waiting on the site
+MAX_WORKERS = 4
+# Upper bound on one account's login and scrape; a wedged browser is closed after this
+RUN_DEADLINE = 90
+# Ceiling for explicit waits, so a failing step gives up quickly; WAIT_SLOW is for the post-refresh grid
+WAIT = 10
+WAIT_SLOW = 15
+BRUNEI_TZ = timezone(timedelta(hours=8))
+PROFILE_DIR = os.path.join(os.path.expanduser("~"), ".usms_scraper_profile")
+# Kept in each account's profile directory, next to the cookies it goes with
+MAIN_PAGE_URL_FILE = "usms_main_page_url"
+# Third-party analytics beacons; blocked so they can't hold up a page (images are already off)
+BLOCKED_URLS = (
+    "*google-analytics.com*",
+    "*googletagmanager.com*",
+    "*doubleclick.net*",
+)
 
 # --- Element Locators (using NAME attribute from previous findings) ---
 username_field_name = "ASPxRoundPanel1$txtUsername"
 password_field_name = "ASPxRoundPanel1$txtPassword"
 login_button_name = "ASPxRoundPanel1$btnLogin"
 
-# --- WebDriver Setup ---
-driver = setup_driver()
-if not driver:
-    print("Failed to setup WebDriver. Exiting.")
-    exit()
-
-driver.set_window_size(1456, 1020)
+# --- Element Locators (built once; the functions above reuse them on every run and poll) ---
+USERNAME_LOC = (By.ID, "ASPxRoundPanel1_txtUsername_I")
+MY_FRAME_LOC = (By.ID, "MyFrame")
+CONSUMPTION_LINK_LOC = (By.CSS_SELECTOR, "#ASPxCardView1_DXCardLayout0_cell0_18_ASPxHyperLink4_0 > img")
+DOCUMENT_LOC = (By.TAG_NAME, "html")
+TYPE_DD_LOC = (By.ID, "cboType_B-1Img")
+TYPE_OPTION_LOC = (By.ID, "cboType_DDD_L_LBI3T0")
+REFRESH_BTN_LOC = (By.CSS_SELECTOR, "#btnRefresh_CD > .dx-vam")
+HOURLY_TAB_LOC = (By.CSS_SELECTOR, "#ASPxPageControl1_T1T > .dx-vam")
+GRID_LOC = (By.ID, "ASPxPageControl1_grid")
+
+def saved_main_page_url(username):
+    """The MainPage URL remembered in the account's profile by the last login, or None."""
+    try:
+        with open(os.path.join(profile_dir_for(username), MAIN_PAGE_URL_FILE)) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
 
-print(f"Navigating to login page: {login_url}")
-driver.get(login_url)
+def save_main_page_url(username, url):
+    try:
+        with open(os.path.join(profile_dir_for(username), MAIN_PAGE_URL_FILE), "w") as f:
+            f.write(url)
+    except OSError as e:
+        log.debug(f"Could not remember the MainPage URL: {e}")
 
-# Initialize scraped data variables here to ensure they exist in all paths
-dynamic_values = {}
-hourly_consumption = []
-total_kwh = None
+def login(driver, username, password):
+    """
+    Logs in to USMS from the login page.
+    Returns True once the browser has left the login page, False otherwise.
+    """
+    # The profile's cookies usually outlive a run; go straight to the page the last login
+    # reached and only fall back to the login form if the site sends us back there
+    main_page_url = saved_main_page_url(username)
+    if main_page_url:
+        log.debug(f"Navigating to saved MainPage: {main_page_url}")
+        driver.get(main_page_url)
+        if not session_expired(driver):
+            log.info(f"Already logged in; now on page: {driver.current_url}")
+            return True
+        log.debug("Saved session has expired.")
+
+    log.debug(f"Navigating to login page: {login_url}")
+    driver.get(login_url)
+
+    # The persistent profile may still hold a live session, in which case the site skips the form
+    if not session_expired(driver):
+        log.info(f"Already logged in; now on page: {driver.current_url}")
+        save_main_page_url(username, driver.current_url)
+        return True
 
-try:
     # Wait for the username field to be present and visible
-    print("Waiting for username field (ID: ASPxRoundPanel1_txtUsername_I)...")
-    username_input = WebDriverWait(driver, 20).until(
-        EC.element_to_be_clickable((By.ID, "ASPxRoundPanel1_txtUsername_I"))
-    )
-    username_input.click()
-    print("Username field clicked.")
-    username_input.send_keys(username)
-    print("Username entered.")
-
-    # Find and fill the password field
-    print("Waiting for password field (ID: ASPxRoundPanel1_txtPassword_I)...")
-    password_input = WebDriverWait(driver, 10).until(
-        EC.element_to_be_clickable((By.ID, "ASPxRoundPanel1_txtPassword_I"))
+    log.debug("Waiting for username field (ID: ASPxRoundPanel1_txtUsername_I)...")
+    wait(driver, WAIT).until(
+        EC.presence_of_element_located(USERNAME_LOC)
     )
-    password_input.click()
-    print("Password field clicked.")
-    password_input.send_keys(password)
-    print("Password entered.")
-
-    # Find and click the login button
-    print("Waiting for login button (ID: ASPxRoundPanel1_btnLogin_CD)...")
-    login_button = WebDriverWait(driver, 20).until(
-        EC.element_to_be_clickable((By.ID, "ASPxRoundPanel1_btnLogin_CD"))
-    )
-    print("Login button is clickable. Attempting to click...")
-    login_button.click()
-    print("Login button clicked.")
 
-    print("Waiting up to 10 seconds for URL to change after login...")
-    WebDriverWait(driver, 10).until(EC.url_changes(login_url))
+    # Fill both fields and press the login button in a single script call
+    submit_usms_login(driver, username, password)
+    log.debug("Username and password entered. Login button clicked.")
+
+    log.debug(f"Waiting up to {WAIT} seconds for URL to change after login...")
+    wait(driver, WAIT).until(EC.url_changes(login_url))
 
     current_url = driver.current_url
-    print(f"Current URL after login attempt: {current_url}")
+    log.debug(f"Current URL after login attempt: {current_url}")
 
     if "reslogin" not in current_url.lower():
-        print("Login successful! URL has changed.")
-        print(f"Now on page: {driver.current_url}")
+        log.info("Login successful! URL has changed.")
+        log.debug(f"Now on page: {driver.current_url}")
+        save_main_page_url(username, current_url)
+        return True
+
+    # Fetch the page source once and check it for both failure markers
+    page_source = driver.page_source
+    if "Invalid IC Number or Password" in page_source:
+        log.warning("Login failed: Invalid IC Number or Password message found on page.")
+    elif username_field_name in page_source: # Check if login fields are still present
+        log.warning("Login failed: Still on the login page (login fields detected).")
+    else:
+        log.warning("Login status uncertain. Please check the browser window and console output.")
+        log.warning(f"Page title: {driver.title}")
+    return False
+
+def session_expired(driver):
+    """True if USMS has sent the browser back to the login page."""
+    return "reslogin" in driver.current_url.lower()
 
-        print("Allowing MainPage to settle for 3 seconds...")
-        time.sleep(3)
+def run_once(driver, main_page_url=None):
+    """
+    Scrapes meter and hourly consumption data from a logged-in session.
+    Pass the MainPage URL to return there first, as a repeated poll must.
+    Returns a dict of the scraped data, or None on failure.
+    """
+    # Initialize scraped data variables here to ensure they exist in all paths
+    dynamic_values = {}
+    hourly_consumption = []
+    total_kwh = None
+    result = None
+    # A fresh page load or login always leaves the driver in the top-level document
+    frames = FrameCtx(driver)
 
+    try:
+        if main_page_url:
+            # The previous poll left the frames on the consumption page; reload MainPage
+            driver.get(main_page_url)
+            if session_expired(driver):
+                log.warning("Session expired; the site redirected to the login page.")
+                return None
+
+        # Scrape all meter data first (electricity and water meters)
+        all_meter_data = scrape_all_meters(driver, frames)
+        if all_meter_data:
+            log.info(f"Meter Data: {all_meter_data}")
+        else:
+            log.warning("Failed to retrieve meter data or no meters found.")
+
+        # For backward compatibility, extract electricity meter data as dynamic_values
+        dynamic_values = {}
+        if 'electricity' in all_meter_data:
+            elec_data = all_meter_data['electricity']
+            dynamic_values = {
+                "Remaining Unit": elec_data.get("Remaining Unit"),
+                "Remaining Balance": elec_data.get("Remaining Balance"), 
+                "Last Updated": elec_data.get("Last Updated")
+            }
+
+        # The consumption link sits on the same card view as the meters, so stay in
+        # 'MyFrame' rather than leaving it and switching back in by index
+        if not frames.in_frame:
+            log.debug("Switching to iframe 'MyFrame' for consumption details...")
+            frames.enter(MY_FRAME_LOC)
+
+        log.debug("Waiting for consumption image link (CSS: #ASPxCardView1_DXCardLayout0_cell0_18_ASPxHyperLink4_0 > img)...")
+        consumption_link_img = wait(driver, WAIT).until(
+            EC.element_to_be_clickable(CONSUMPTION_LINK_LOC)
+        )
+        log.debug("Consumption image link found. Clicking...")
+        old_document = driver.find_element(*DOCUMENT_LOC)
+        consumption_link_img.click()
+        log.debug("Consumption image link clicked.")
+        # The link reloads the frame; wait for the old document to go away
+        wait(driver, WAIT).until(EC.staleness_of(old_document))
+
+        log.debug("Waiting for 'Type' dropdown trigger (ID: cboType_B-1Img)...")
+        type_dropdown_trigger = wait(driver, WAIT).until(
+            EC.element_to_be_clickable(TYPE_DD_LOC)
+        )
+        type_dropdown_trigger.click()
+        log.debug("'Type' dropdown trigger clicked.")
+
+        log.debug("Waiting for 'Type' option (ID: cboType_DDD_L_LBI3T0)...")
+        type_option = wait(driver, WAIT).until(
+            EC.element_to_be_clickable(TYPE_OPTION_LOC)
+        )
+        type_option.click()
+        log.debug("'Type' option selected.")
+        wait(driver, WAIT).until(EC.invisibility_of_element_located(TYPE_OPTION_LOC))
+        wait(driver, WAIT).until(page_is_idle)
+
+        log.debug("Waiting for refresh button (CSS: #btnRefresh_CD > .dx-vam)...")
+        refresh_button = wait(driver, WAIT).until(
+            EC.element_to_be_clickable(REFRESH_BTN_LOC)
+        )
+        refresh_button.click()
+        log.debug("Refresh button clicked.")
+        # The refresh rebuilds the grid server-side, the one step that is routinely slow
+        wait(driver, WAIT_SLOW).until(page_is_idle)
+
+        log.debug("Waiting for data tab/view (CSS: #ASPxPageControl1_T1T > .dx-vam)...")
+        data_tab = wait(driver, WAIT).until(
+            EC.element_to_be_clickable(HOURLY_TAB_LOC)
+        )
+        data_tab.click()
+        log.debug("Data tab/view clicked.")
+        # scrape_data_from_table waits for the grid itself
+
+        # At this point, the page with the data table should be loaded.
+        # Now, attempt to scrape data from the table.
+        log.debug("Attempting to scrape data from table...")
+        hourly_consumption, total_kwh = scrape_data_from_table(driver)
+
+        if hourly_consumption:
+            log.debug("\nHourly Consumption:")
+            for item in hourly_consumption:
+                log.debug(f"  Hour: {item['hour']}, kWh: {item['consumption_kWh']}")
+
+        if total_kwh:
+            log.info(f"\nTotal Consumption: {total_kwh} kWh")
+        else:
+            log.warning("\nCould not retrieve total consumption.")
+        # Excel export and MQTT publishing happen once all accounts are done
+        result = {
+            "hourly_consumption": hourly_consumption,
+            "total_kwh": total_kwh,
+            "dynamic_values": dynamic_values,
+            "all_meter_data": all_meter_data,
+        }
+
+    except TimeoutException as nav_te:
+        log.error(f"A timeout occurred during navigation or interaction after login: {nav_te}")
+    except Exception as nav_e:
+        log.error(f"An error occurred after login: {nav_e}")
+    finally:
+        # Switch back to default content, after success or error alike
         try:
-            # Scrape all meter data first (electricity and water meters)
-            all_meter_data = scrape_all_meters(driver)
-            if all_meter_data:
-                print(f"Meter Data: {all_meter_data}")
-            else:
-                print("Failed to retrieve meter data or no meters found.")
-
-            # For backward compatibility, extract electricity meter data as dynamic_values
-            dynamic_values = {}
-            if 'electricity' in all_meter_data:
-                elec_data = all_meter_data['electricity']
-                dynamic_values = {
-                    "Remaining Unit": elec_data.get("Remaining Unit"),
-                    "Remaining Balance": elec_data.get("Remaining Balance"), 
-                    "Last Updated": elec_data.get("Last Updated")
-                }
-
-            # Proceed with navigating to the consumption data page
-            # This part assumes dynamic_values were scraped from 'MyFrame', and we are now in default content.
-            # The next operations might be within the same 'MyFrame' or another one.
-            # The original code switches to iframe by index 0 *after* this.
-            # Let's ensure we are in the correct context or switch to the main iframe for consumption details.
-
-            # Attempt to switch to the main content iframe if not already there or if operations require it.
-            # This might be redundant if scrape_dynamic_values correctly returns to default_content
-            # and the subsequent operations are within a new iframe context.
-            # The original code had: WebDriverWait(driver, 20).until(EC.frame_to_be_available_and_switch_to_it(0))
-            # This implies the consumption link is in the *first* iframe on the page.
-
-            print("Attempting to switch to the main content iframe (index 0) for consumption details...")
-            WebDriverWait(driver, 20).until(EC.frame_to_be_available_and_switch_to_it(0)) # Assumes this is the correct frame for consumption link
-            print("Switched to main content iframe (index 0).")
-            time.sleep(1) # Allow frame content to load
-
-            print("Waiting for consumption image link (CSS: #ASPxCardView1_DXCardLayout0_cell0_18_ASPxHyperLink4_0 > img)...")
-            consumption_link_img = WebDriverWait(driver, 30).until(
-                EC.element_to_be_clickable((By.CSS_SELECTOR, "#ASPxCardView1_DXCardLayout0_cell0_18_ASPxHyperLink4_0 > img"))
-            )
-            print("Consumption image link found. Clicking...")
-            consumption_link_img.click()
-            print("Consumption image link clicked.")
-            time.sleep(2) # Allow page to react
-
-            print("Waiting for 'Type' dropdown trigger (ID: cboType_B-1Img)...")
-            type_dropdown_trigger = WebDriverWait(driver, 20).until(
-                EC.element_to_be_clickable((By.ID, "cboType_B-1Img"))
-            )
-            type_dropdown_trigger.click()
-            print("'Type' dropdown trigger clicked.")
-            time.sleep(1) # Allow dropdown to appear
+            frames.leave()
+        except Exception:
+            pass
 
-            print("Waiting for 'Type' option (ID: cboType_DDD_L_LBI3T0)...")
-            type_option = WebDriverWait(driver, 10).until(
-                EC.element_to_be_clickable((By.ID, "cboType_DDD_L_LBI3T0"))
-            )
-            type_option.click()
-            print("'Type' option selected.")
-            time.sleep(1) # Allow selection to process
+    return result
 
-            print("Waiting for refresh button (CSS: #btnRefresh_CD > .dx-vam)...")
-            refresh_button = WebDriverWait(driver, 20).until(
-                EC.element_to_be_clickable((By.CSS_SELECTOR, "#btnRefresh_CD > .dx-vam"))
-            )
-            refresh_button.click()
-            print("Refresh button clicked.")
-            time.sleep(3) # Allow data to refresh
+def start_deadline(driver, seconds=None):
+    """
+    Starts a watchdog that quits the driver once the run's deadline passes, so a
+    wedged wait or command fails fast instead of stalling the whole run.
+    Cancel the returned timer when the run finishes; its expired event is set
+    if the watchdog fired.
+    """
+    seconds = seconds or RUN_DEADLINE
+
+    def expire():
+        timer.expired.set()
+        log.error(f"Run exceeded its {seconds}s deadline; closing the browser.")
+        try:
+            driver.quit()
+        except Exception:
+            pass
 
-            print("Waiting for data tab/view (CSS: #ASPxPageControl1_T1T > .dx-vam)...")
-            data_tab = WebDriverWait(driver, 20).until(
-                EC.element_to_be_clickable((By.CSS_SELECTOR, "#ASPxPageControl1_T1T > .dx-vam"))
+    timer = threading.Timer(seconds, expire)
+    timer.expired = threading.Event()
+    timer.daemon = True
+    timer.start()
+    return timer
+
+def scrape_account(username, password):
+    """
+    Logs in to USMS with one account in its own browser and scrapes its meter and
+    hourly consumption data. Returns a dict of the scraped data, or None on failure.
+    """
+    # --- WebDriver Setup ---
+    driver = setup_driver(build_usms_chrome_options(profile_dir_for(username)), BLOCKED_URLS)
+    if not driver:
+        log.error("Failed to setup WebDriver.")
+        return None
+
+    deadline = start_deadline(driver)
+    try:
+        if login(driver, username, password):
+            return run_once(driver)
+        log.warning("Script finished checks. Browser will close shortly.")
+    except TimeoutException as te: # Catch TimeoutException specifically
+        log.error(f"A timeout occurred during an explicit wait: {te}")
+    except Exception as e:
+        log.error(f"An error occurred: {e}")
+    finally:
+        deadline.cancel()
+        log.info("Closing the browser.")
+        driver.quit()
+    return None
+
+def export_and_publish(results, usernames):
+    """
+    Exports the scraped data of every account to Excel and publishes the readings
+    of the first configured account via MQTT.
+    results is a list of (username, data) pairs for the accounts that succeeded;
+    usernames lists every configured account in credentials-file order.
+    """
+    hourly_consumption = results[0][1]["hourly_consumption"]
+    total_kwh = results[0][1]["total_kwh"]
+    dynamic_values = results[0][1]["dynamic_values"]
+    all_meter_data = results[0][1]["all_meter_data"]
+
+    if len(results) > 1:
+        # Several accounts go into one workbook, one set of sheets per account. Sheets are
+        # labelled by the account's position in the credentials file rather than its IC number,
+        # which is a personal ID and would otherwise crowd the sheet name past Excel's limit
+        sheets = []
+        for account, data in results:
+            account_index = usernames.index(account) + 1
+            for sheet in prepare_usms_sheets(data["hourly_consumption"], data["total_kwh"],
+                                             data["dynamic_values"], data["all_meter_data"]):
+                sheets.append({**sheet, "name": f"Acct{account_index} {sheet['name']}"})
+        excel_path = export_batch(sheets, filename_prefix="MeterData")
+        if excel_path:
+            log.info(f"\nData successfully saved to {excel_path}")
+        else:
+            log.warning("\nFailed to save data to Excel.")
+    elif hourly_consumption or all_meter_data:
+        try:
+            excel_path = export_usms_data(
+                hourly_consumption=hourly_consumption,
+                total_kwh=total_kwh,
+                dynamic_values=dynamic_values,
+                all_meter_data=all_meter_data
             )
-            data_tab.click()
-            print("Data tab/view clicked.")
-            time.sleep(2) # Allow tab content to load
-
-            # At this point, the page with the data table should be loaded.
-            # Now, attempt to scrape data from the table.
-            print("Attempting to scrape data from table...")
-            hourly_consumption, total_kwh = scrape_data_from_table(driver)
-
-            if hourly_consumption:
-                print("\nHourly Consumption:")
-                for item in hourly_consumption:
-                    print(f"  Hour: {item['hour']}, kWh: {item['consumption_kWh']}")
-            
-            if total_kwh:
-                print(f"\nTotal Consumption: {total_kwh} kWh")
+            if excel_path:
+                log.info(f"\nData successfully saved to {excel_path}")
             else:
-                print("\nCould not retrieve total consumption.")
-            if hourly_consumption or all_meter_data:
-                try:
-                    excel_path = export_usms_data(
-                        hourly_consumption=hourly_consumption,
-                        total_kwh=total_kwh,
-                        dynamic_values=dynamic_values,
-                        all_meter_data=all_meter_data
-                    )
-                    if excel_path:
-                        print(f"\nData successfully saved to {excel_path}")
-                    else:
-                        print("\nFailed to save data to Excel.")
-                except Exception as e:
-                    print(f"\nError saving data to Excel: {e}")
-            else:
-                print("\nNo data to save to Excel.")
-            # --- End Save to Excel ---
-              # --- MQTT Publishing ---
-            mqtt_payload = {}
-            
-            # Add all meter data (electricity and water)
-            if all_meter_data:
-                mqtt_payload['meters'] = all_meter_data
-            
-            # Add backward compatibility for dynamic values
-            if dynamic_values:
-                mqtt_payload.update(dynamic_values)
-            
-            # For hourly data, you might want to decide how to structure it.
-            # Publishing a list of hourly readings might be too verbose for some MQTT use cases.
-            # For now, let's add it directly.
-            if hourly_consumption:
-                mqtt_payload['hourly_consumption'] = hourly_consumption
-            
-            if total_kwh is not None: # Ensure total_kwh is not None before adding
-                mqtt_payload['total_consumption_kwh'] = total_kwh
-            
-            if mqtt_payload: # Check if there's anything to publish
-                # Convert to Brunei time (UTC+8)
-                utc_now = datetime.now(timezone.utc)
-                brunei_tz = timezone(timedelta(hours=8))
-                brunei_now = utc_now.astimezone(brunei_tz)
-                mqtt_payload['mqtt_timestamp'] = brunei_now.isoformat()
-                print("\nAttempting to publish USMS data via MQTT...")
-                try:
-                    if publish_usms_json(mqtt_payload):
-                        print("✅ USMS data published successfully via MQTT.")
-                    else:
-                        print("❌ Failed to publish USMS data via MQTT. Check mqtt_publisher logs for details.")
-                except Exception as e:
-                    print(f"❌ An error occurred during MQTT publishing for USMS data: {e}")
+                log.warning("\nFailed to save data to Excel.")
+        except Exception as e:
+            log.error(f"\nError saving data to Excel: {e}")
+    else:
+        log.warning("\nNo data to save to Excel.")
+    # --- End Save to Excel ---
+
+    # --- MQTT Publishing ---
+    # The USMS topics are fixed, so only the first configured account's readings are published.
+    # Messages are retained, so if that account failed, publish nothing rather than let another
+    # account's meter take over its topics.
+    if results[0][0] != usernames[0]:
+        log.warning("\nSkipping MQTT publish for USMS: the first configured account was not scraped.")
+        return
+
+    # One timestamp for both topics; the publisher serializes datetimes as ISO 8601
+    mqtt_timestamp = datetime.now(BRUNEI_TZ)
+
+    # Electricity: the card's dynamic values plus the hourly readings and their total.
+    # Unread values are left out, as for water, so a failed read doesn't overwrite the retained reading
+    electricity_payload = {key: value for key, value in dynamic_values.items() if value is not None}
+    if hourly_consumption:
+        electricity_payload['hourly_consumption'] = hourly_consumption
+    if total_kwh is not None: # Ensure total_kwh is not None before adding
+        electricity_payload['total_consumption_kwh'] = total_kwh
+
+    # Water: the same card values, when the account has a water meter
+    water_payload = {}
+    water_data = all_meter_data.get('water') or {}
+    for key in ("Remaining Unit", "Remaining Balance", "Last Updated"):
+        if water_data.get(key) is not None:
+            water_payload[key] = water_data[key]
+
+    for payload in (electricity_payload, water_payload):
+        if payload:
+            payload['mqtt_timestamp'] = mqtt_timestamp
+
+    if electricity_payload or water_payload: # Check if there's anything to publish
+        log.info("\nAttempting to publish USMS data via MQTT...")
+        try:
+            if publish_usms_json(electricity_payload or None, water_payload or None):
+                log.info("✅ USMS data published successfully via MQTT.")
             else:
-                print("\nSkipping MQTT publish for USMS: No data prepared.")
-            # --- End MQTT Publishing ---
-
-            # Switch back to default content if you need to interact outside the iframe later
-            driver.switch_to.default_content()
-            print("Switched back to default content after all operations in iframe.")
-
-        except TimeoutException as nav_te:
-            print(f"A timeout occurred during navigation or interaction after login: {nav_te}")
-            try:
-                driver.switch_to.default_content() # Ensure switch back on error
-            except Exception:
-                pass
-        except Exception as nav_e:
-            print(f"An error occurred after login: {nav_e}")
-            try:
-                driver.switch_to.default_content() # Ensure switch back on error
-            except Exception:
-                pass
-        # ==============================================================================
-
-    elif "Invalid IC Number or Password" in driver.page_source:
-        print("Login failed: Invalid IC Number or Password message found on page.")
-    elif username_field_name in driver.page_source: # Check if login fields are still present
-        print("Login failed: Still on the login page (login fields detected).")
+                log.warning("❌ Failed to publish USMS data via MQTT. Check mqtt_publisher logs for details.")
+        except Exception as e:
+            log.error(f"❌ An error occurred during MQTT publishing for USMS data: {e}")
     else:
-        print("Login status uncertain. Please check the browser window and console output.")
-        print("Page title:", driver.title)
-
-    print("Script finished checks. Browser will close shortly.")
+        log.warning("\nSkipping MQTT publish for USMS: No data prepared.")
+    # --- End MQTT Publishing ---
+
+def load_accounts():
+    """Returns the USMS (username, password) pairs that have both values set."""
+    return [
+        (username, password)
+        for username, password in load_all_credentials() # Loads USMS credentials from credentials.json by default
+        if username and password
+    ]
 
-except TimeoutException as te: # Catch TimeoutException specifically
-    print(f"A timeout occurred during an explicit wait: {te}")
-except Exception as e:
-    print(f"An error occurred: {e}")
+def main_loop(accounts, interval=3600):
+    """
+    Keeps one logged-in browser per account and scrapes every interval seconds,
+    so Chrome start-up and login are paid once instead of on every poll.
+    Logs in again only when the site has expired the session.
+    """
+    sessions = []
+    try:
+        for username, password in accounts:
+            driver = setup_driver(build_usms_chrome_options(profile_dir_for(username)), BLOCKED_URLS)
+            if not driver:
+                log.error("Failed to setup WebDriver.")
+                continue
+            sessions.append({"username": username, "password": password, "driver": driver, "main_page_url": None})
+
+        def poll(session):
+            if session["driver"] is None:
+                # The previous poll hit its deadline and lost its browser; start a fresh one
+                session["driver"] = setup_driver(build_usms_chrome_options(profile_dir_for(session["username"])), BLOCKED_URLS)
+                session["main_page_url"] = None
+                if not session["driver"]:
+                    log.error("Failed to setup WebDriver.")
+                    return session["username"], None
+            driver = session["driver"]
+            deadline = start_deadline(driver)
+            try:
+                for _ in range(2):
+                    try:
+                        if session["main_page_url"] is None or session_expired(driver):
+                            if not login(driver, session["username"], session["password"]):
+                                return session["username"], None
+                            session["main_page_url"] = driver.current_url
+                            # login() has just loaded MainPage, so there is nothing to reload
+                            data = run_once(driver)
+                        else:
+                            data = run_once(driver, session["main_page_url"])
+                    except Exception as e:
+                        log.error(f"An error occurred: {e}")
+                        data = None
+                    if data is not None or not session_expired(driver):
+                        return session["username"], data
+                    # The session lapsed between polls; log in again and retry once
+                return session["username"], None
+            except Exception as e:
+                log.error(f"An error occurred: {e}")
+                return session["username"], None
+            finally:
+                deadline.cancel()
+                if deadline.expired.is_set():
+                    session["driver"] = None
+
+        with ThreadPoolExecutor(max_workers=max(1, min(len(sessions), MAX_WORKERS))) as executor:
+            while sessions:
+                results = [(username, data) for username, data in executor.map(poll, sessions) if data]
+                if results:
+                    export_and_publish(results, [account[0] for account in accounts])
+                log.info(f"Next poll in {interval} seconds.")
+                time.sleep(interval)
+    finally:
+        log.info("Closing the browser.")
+        for session in sessions:
+            if session["driver"]:
+                session["driver"].quit()
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    set_client_suffix("usms")
+    parser = argparse.ArgumentParser(description="Scrape USMS smart meter data.")
+    parser.add_argument("--poll", type=int, metavar="SECONDS",
+                        help="keep the browsers logged in and scrape again every SECONDS")
+    args = parser.parse_args(argv)
+
+    accounts = load_accounts()
+    if not accounts:
+        log.error("Exiting script due to credential loading issues.")
+        return
 
-finally:
-    print("Closing the browser.")
-    driver.quit()
+    try:
+        if args.poll:
+            main_loop(accounts, args.poll)
+            return
+
+        with ThreadPoolExecutor(max_workers=min(len(accounts), MAX_WORKERS)) as executor:
+            results = list(executor.map(lambda account: (account[0], scrape_account(*account)), accounts))
+        results = [(username, data) for username, data in results if data]
+
+        if results:
+            export_and_publish(results, [account[0] for account in accounts])
+    finally:
+        # atexit does not run reliably in run_all.py's worker processes; flush and disconnect now
+        close_client()
+
+if __name__ == "__main__":
+    main()
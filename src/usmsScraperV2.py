@@ -1,53 +1,18 @@
-from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException
-import json # Added for loading credentials
-import time
-from mqtt_publisher import publish_usms_json # Added for MQTT publishing
-import os # Added
+from mqtt_publisher import publish_usms_json, set_client_suffix, close_client # Added for MQTT publishing
 from datetime import datetime, timezone, timedelta # Added timezone, timedelta
 from excel_exporter import export_usms_data # Ensure this line is present
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import logging
+import os
 
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options # Added
-from webdriver_manager.chrome import ChromeDriverManager
-
-# Function to load credentials from a JSON file
-def load_credentials(file_path=None, service="USMS"):
-    if file_path is None:
-        # Get the directory where this script is located
-        import os
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        file_path = os.path.join(script_dir, "credentials.json")
-    try:
-        with open(file_path, 'r') as f:
-            creds = json.load(f)
-            # Check if the service exists in the credentials
-            if service not in creds:
-                print(f"Error: Service '{service}' not found in '{file_path}'.")
-                return None, None
-            
-            service_creds = creds[service]
-            # Return username and password for USMS, or serviceNumber and accountNumber for other services
-            if service == "USMS":
-                return service_creds.get("username"), service_creds.get("password")
-            elif service == "Imagine":
-                return service_creds.get("serviceNumber"), service_creds.get("accountNumber")
-            else:
-                # For future services, you can add more conditions here
-                print(f"Error: Unknown service '{service}'.")
-                return None, None
-    except FileNotFoundError:
-        print(f"Error: Credentials file '{file_path}' not found.")
-        return None, None
-    except json.JSONDecodeError:
-        print(f"Error: Could not decode JSON from '{file_path}'.")
-        return None, None
-    except KeyError as e:
-        print(f"Error: Required key not found in '{file_path}': {e}")
-        return None, None
+from scraper_common import (load_credentials, setup_driver, wait, build_usms_chrome_options, submit_usms_login,
+                            find_meter_cards, read_meter_fields, METER_FIELD_ITEMS)
+
+log = logging.getLogger(__name__)
 
 def scrape_data_from_table(driver):
     """
@@ -59,46 +24,48 @@ def scrape_data_from_table(driver):
 
     try:
         # Wait for the main data table to be present (same as V1)
-        data_table = WebDriverWait(driver, 10).until(
+        data_table = wait(driver, 10).until(
             EC.presence_of_element_located((By.ID, "ASPxPageControl1_grid_DXMainTable"))
         )
-        print("Data table found.")
-
-        # Find all data rows for hourly consumption (but don't extract data)
-        data_rows = data_table.find_elements(By.CLASS_NAME, "dxgvDataRow")
-        print(f"Found {len(data_rows)} hourly data rows.")
+        log.debug("Data table found.")
+
+        # Count each data row's and the footer row's cells in one script call (but don't extract data)
+        shape = driver.execute_script(
+            "const rows = arguments[0].querySelectorAll('tr.dxgvDataRow');"
+            "const footer = document.getElementById('ASPxPageControl1_grid_DXFooterRow');"
+            "return {"
+            "  rows: Array.from(rows, r => r.querySelectorAll('td').length),"
+            "  footer: footer ? footer.querySelectorAll('td').length : null"
+            "};",
+            data_table,
+        )
+        log.debug(f"Found {len(shape['rows'])} hourly data rows.")
         
         # Simulate processing rows without extracting data
-        for i, row in enumerate(data_rows):
-            cols = row.find_elements(By.TAG_NAME, "td")
-            if len(cols) == 2:
+        for i, col_count in enumerate(shape['rows']):
+            if col_count == 2:
                 # Instead of extracting actual data, use mock data
                 hour = f"Hour {i+1}"
                 consumption = "0.000"
                 hourly_data.append({"hour": hour, "consumption_kWh": consumption})
-                print(f"  Simulated row {i+1}: {hour} - {consumption} kWh")
+                log.debug(f"  Simulated row {i+1}: {hour} - {consumption} kWh")
             else:
-                print(f"Skipping row with unexpected number of columns: row index {i}")
+                log.warning(f"Skipping row with unexpected number of columns: row index {i}")
 
-        # Find the footer row for total consumption (but don't extract data)
-        footer_table = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.ID, "ASPxPageControl1_grid_DXFooterTable"))
-        )
-        footer_row = footer_table.find_element(By.ID, "ASPxPageControl1_grid_DXFooterRow")
-        if footer_row:
-            print("Footer row found.")
-            cols = footer_row.find_elements(By.TAG_NAME, "td")
-            if len(cols) == 2:
+        # The footer row is rendered with the grid, so it needs no wait of its own
+        if shape['footer'] is not None:
+            log.debug("Footer row found.")
+            if shape['footer'] == 2:
                 # Simulate total consumption without extracting actual data
                 total_consumption = "0.000"
-                print(f"  Simulated total consumption: {total_consumption} kWh")
+                log.debug(f"  Simulated total consumption: {total_consumption} kWh")
             else:
-                print("Footer row has unexpected number of columns: row found but structure unexpected")
+                log.warning("Footer row has unexpected number of columns: row found but structure unexpected")
         else:
-            print("Footer row not found.")
+            log.warning("Footer row not found.")
 
     except Exception as e:
-        print(f"Error during table simulation: {e}")
+        log.error(f"Error during table simulation: {e}")
 
     return hourly_data, total_consumption
 
@@ -111,358 +78,276 @@ def scrape_meter_data(driver, meter_index):
     meter_type = "Electricity" if meter_index == 0 else "Water"
     
     try:
-        # Define the selectors for this specific meter (same as V1)
-        base_id = f"ASPxCardView1_DXCardLayout{meter_index}"
-        
-        # Collect all fields for both meter types (same selectors as V1)
-        fields = {
-            "Meter No": f"#{base_id}_2 .dxflNestedControlCell",
-            "Full Name": f"#{base_id}_4 .dxflNestedControlCell", 
-            "Meter Status": f"#{base_id}_5 .dxflNestedControlCell",
-            "Address": f"#{base_id}_6 .dxflNestedControlCell",
-            "Kampong": f"#{base_id}_7 .dxflNestedControlCell",
-            "Mukim": f"#{base_id}_8 .dxflNestedControlCell",
-            "District": f"#{base_id}_9 .dxflNestedControlCell",
-            "Postcode": f"#{base_id}_10 .dxflNestedControlCell",
-            "Remaining Unit": f"#{base_id}_11 .dxflNestedControlCell",
-            "Remaining Balance": f"#{base_id}_12 .dxflNestedControlCell",
-            "Last Updated": f"#{base_id}_17 .dxflNestedControlCell"
-        }
-
-        print(f"\nScraping {meter_type} meter data...")
-        
-        for field_name, css_selector in fields.items():
-            try:
-                element = WebDriverWait(driver, 10).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, css_selector))
-                )
-                # Extract actual data (same as V1)
-                meter_data[field_name] = element.text.strip()
-                print(f"  {field_name}: {element.text.strip()}")
-            except TimeoutException:
-                print(f"  Error: Timed out waiting for {field_name} to load.")
-                meter_data[field_name] = None
-            except Exception as e:
-                print(f"  Error getting {field_name}: {e}")
-                meter_data[field_name] = None
+        log.debug(f"\nScraping {meter_type} meter data...")
+
+        # scrape_all_meters only gets here once this meter's card is in the DOM, and the card
+        # renders all its fields in the same paint, so read them without waiting
+        values = read_meter_fields(driver, meter_index)
+
+        for field_name in METER_FIELD_ITEMS:
+            meter_data[field_name] = values.get(field_name)
+            if meter_data[field_name] is None:
+                log.warning(f"  Error: {field_name} not found.")
+            else:
+                log.debug(f"  {field_name}: {meter_data[field_name]}")
                 
         # Add meter type for identification
         meter_data["Meter Type"] = meter_type
         
     except Exception as e:
-        print(f"Error scraping {meter_type} meter data: {e}")
+        log.error(f"Error scraping {meter_type} meter data: {e}")
         
     return meter_data
 
-def scrape_all_meters(driver):
+def scrape_all_meters(driver, already_in_frame=False):
     """
     Version 2: Scrapes actual data from all available meters (same as V1).
     The difference from V1 is that V2 doesn't scrape the table data at the end.
+    Pass already_in_frame=True if the caller has already switched into 'MyFrame'.
     """
     all_meters = {}
     
     try:
-        # Switch to the iframe 'MyFrame' using its ID (same as V1)
-        try:
-            driver.switch_to.default_content()
-            print("Switched to default content before attempting to switch to MyFrame.")
-        except Exception:
-            pass
+        if not already_in_frame:
+            # Switch to the iframe 'MyFrame' using its ID (same as V1)
+            try:
+                driver.switch_to.default_content()
+                log.debug("Switched to default content before attempting to switch to MyFrame.")
+            except Exception:
+                pass
 
-        WebDriverWait(driver, 10).until(EC.frame_to_be_available_and_switch_to_it((By.ID, "MyFrame")))
-        print("Switched to iframe 'MyFrame'.")
+            wait(driver, 10).until(EC.frame_to_be_available_and_switch_to_it((By.ID, "MyFrame")))
+            log.debug("Switched to iframe 'MyFrame'.")
 
-        # Check which meters are available by looking for their card elements (same as V1)
+        # Check which meters are available by looking for their card elements, both in one call
         available_meters = []
-        # Check for electricity meter (index 0)
-        try:
-            driver.find_element(By.ID, "ASPxCardView1_DXDataCard0")
-            available_meters.append((0, "Electricity"))
-            print("Electricity meter found.")
-        except Exception:
-            print("Electricity meter not found.")
-            
-        # Check for water meter (index 1) 
-        try:
-            driver.find_element(By.ID, "ASPxCardView1_DXDataCard1")
-            available_meters.append((1, "Water"))
-            print("Water meter found.")
-        except Exception:
-            print("Water meter not found.")
-              # Scrape data from each available meter
+        for meter_index, meter_name, found in find_meter_cards(driver):
+            if found:
+                available_meters.append((meter_index, meter_name))
+                log.debug(f"{meter_name} meter found.")
+            else:
+                log.warning(f"{meter_name} meter not found.")
+        # Scrape data from each available meter, stamping them all with one execution time
+        scrape_time = datetime.now(BRUNEI_TZ).isoformat()
         for meter_index, meter_name in available_meters:
             meter_data = scrape_meter_data(driver, meter_index)
             # Add script execution timestamp to each meter (same as V1)
             if meter_data:
-                utc_now = datetime.now(timezone.utc)
-                brunei_tz = timezone(timedelta(hours=8))
-                brunei_now = utc_now.astimezone(brunei_tz)
-                meter_data['Script Execution Time'] = brunei_now.isoformat()
+                meter_data['Script Execution Time'] = scrape_time
             all_meters[meter_name.lower()] = meter_data        # Switch back to the default content after scraping (same as V1)
         driver.switch_to.default_content()
-        print("Switched back to default content from MyFrame.")
+        log.debug("Switched back to default content from MyFrame.")
 
     except Exception as e:
-        print(f"Error scraping meter data: {e}")
+        log.error(f"Error scraping meter data: {e}")
         try:
             driver.switch_to.default_content()
-            print("Switched back to default content after error in meter data scraping.")
+            log.debug("Switched back to default content after error in meter data scraping.")
         except Exception:
             pass
             
     return all_meters
 
-def setup_driver():
-    """Initializes and returns a Chrome WebDriver instance."""
-    options = Options()
-    chrome_exe_paths_to_try = [
-        r"C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe",
-        r"C:\\Program Files (x86)\\Google\\Chrome\\Application\\chrome.exe",
-        rf"C:\\Users\\{os.getlogin()}\\AppData\\Local\\Google\\Chrome\\Application\\chrome.exe"
-    ]
-    found_chrome_binary = False
-    for path_option in chrome_exe_paths_to_try:
-        if os.path.exists(path_option):
-            options.binary_location = path_option
-            print(f"Using Chrome binary location: {path_option}")
-            found_chrome_binary = True
-            break
-    if not found_chrome_binary:
-        print("WARNING: Chrome binary not found at common locations. Selenium will try to locate it automatically.")
-        print(f"Looked in: {chrome_exe_paths_to_try}")
-
-    try:
-        raw_driver_path = ChromeDriverManager().install()
-        print(f"Raw ChromeDriver Path from WDM: {raw_driver_path}")
-    except Exception as e:
-        print(f"Error calling ChromeDriverManager().install(): {e}")
-        print("Please ensure webdriver-manager is installed and can access the internet.")
+def build_mqtt_payload(meter_data, timestamp):
+    """
+    Picks the MQTT_KEYS readings that have a value out of one meter's data and
+    stamps them with the timestamp. Returns None if there is nothing to publish.
+    """
+    meter_data = meter_data or {}
+    payload = {key: value for key, value in ((key, meter_data.get(key)) for key in MQTT_KEYS) if value is not None}
+    if not payload:
         return None
+    payload['mqtt_timestamp'] = timestamp
+    return payload
 
-    normalized_driver_path = os.path.normpath(raw_driver_path)
-    
-    # Try to find chromedriver.exe
-    # Path 1: In the same directory as the file WDM pointed to (e.g., .../chromedriver-win32/chromedriver.exe)
-    potential_path1 = os.path.join(os.path.dirname(normalized_driver_path), "chromedriver.exe")
-    # Path 2: In the parent directory of where WDM pointed (e.g., .../137.0.7151.68/chromedriver.exe)
-    potential_path2 = os.path.join(os.path.dirname(os.path.dirname(normalized_driver_path)), "chromedriver.exe")
-
-    corrected_driver_path = None
-    if os.path.exists(potential_path1):
-        corrected_driver_path = potential_path1
-        print(f"Found ChromeDriver at: {corrected_driver_path}")
-    elif os.path.exists(potential_path2):
-        corrected_driver_path = potential_path2
-        print(f"Found ChromeDriver at: {corrected_driver_path}")
+def save_to_excel(dynamic_values, all_meter_data):
+    """Writes the scraped meter data to an Excel workbook via excel_exporter."""
+    if all_meter_data:
+        try:
+            # Ensure we are calling export_usms_data correctly
+            excel_path = export_usms_data(
+                hourly_consumption=[],  # Empty list as per existing V2 logic
+                total_kwh=None,        # None as per existing V2 logic
+                dynamic_values=dynamic_values, # Pass existing dynamic_values
+                all_meter_data=all_meter_data  # Pass the main meter data
+            )
+            if excel_path:
+                log.info(f"\nData successfully saved to {excel_path}")
+            else:
+                log.warning("\nFailed to save data to Excel.")
+        except Exception as e:
+            log.error(f"\nError saving data to Excel: {e}")
     else:
-        print(f"Initial path from WDM: {normalized_driver_path}")
-        print(f"Checked for ChromeDriver at: {potential_path1}")
-        print(f"Checked for ChromeDriver at: {potential_path2}")
-        print("ERROR: ChromeDriver executable not found at expected locations within .wdm cache.")
-        print("Please check the .wdm cache structure or webdriver-manager installation.")
-        return None
+        log.warning("\nNo meter data to save to Excel.")
 
-    print(f"Using final ChromeDriver Path: {corrected_driver_path}")
-    
+def publish_to_mqtt(electricity_payload, water_payload):
+    """Publishes the electricity and water payloads to their USMS topics."""
+    log.info("\nAttempting to publish USMS data via MQTT to respective topics...")
     try:
-        driver_service = Service(executable_path=corrected_driver_path)
-        driver = webdriver.Chrome(service=driver_service, options=options)
-        return driver
+        # Call the modified publish_usms_json with separate payloads
+        if publish_usms_json(electricity_payload, water_payload):
+            log.info("✅ USMS data (electricity and/or water) published successfully via MQTT.")
+        else:
+            log.warning("❌ Failed to publish some or all USMS data via MQTT. Check mqtt_publisher logs for details.")
     except Exception as e:
-        print(f"Error initializing webdriver.Chrome with path {corrected_driver_path}: {e}")
-        return None
+        log.error(f"❌ An error occurred during MQTT publishing for USMS data: {e}")
 
 # --- Configuration ---
 login_url = "https://www.usms.com.bn/SmartMeter/resLogin"
-
-# Load credentials from file
-username, password = load_credentials() # Loads USMS credentials from credentials.json by default
-
-if not username or not password:
-    print("Exiting script due to credential loading issues.")
-    exit()
+BRUNEI_TZ = timezone(timedelta(hours=8))
+# Persistent Chrome profile, so the USMS session cookie survives from one run to the next.
+# Separate from usmsScraper.py's profiles; Chrome won't share one between two browsers.
+PROFILE_DIR = os.path.join(os.path.expanduser("~"), ".usms_scraper_v2_profile")
 
 # --- Element Locators (using NAME attribute from previous findings) ---
 username_field_name = "ASPxRoundPanel1$txtUsername"
 password_field_name = "ASPxRoundPanel1$txtPassword"
 login_button_name = "ASPxRoundPanel1$btnLogin"
 
-# --- WebDriver Setup ---
-driver = setup_driver()
-if not driver:
-    print("Failed to setup WebDriver. Exiting.")
-    exit()
-
-driver.set_window_size(1456, 1020)
-
-print(f"Navigating to login page: {login_url}")
-driver.get(login_url)
-
-# Initialize scraped data variables here to ensure they exist in all paths
-dynamic_values = {}
-hourly_consumption = []
-total_kwh = None
-
-try:
-    # Wait for the username field to be present and visible
-    print("Waiting for username field (ID: ASPxRoundPanel1_txtUsername_I)...")
-    username_input = WebDriverWait(driver, 20).until(
-        EC.element_to_be_clickable((By.ID, "ASPxRoundPanel1_txtUsername_I"))
-    )
-    username_input.click()
-    print("Username field clicked.")
-    username_input.send_keys(username)
-    print("Username entered.")
-
-    # Find and fill the password field
-    print("Waiting for password field (ID: ASPxRoundPanel1_txtPassword_I)...")
-    password_input = WebDriverWait(driver, 10).until(
-        EC.element_to_be_clickable((By.ID, "ASPxRoundPanel1_txtPassword_I"))
-    )
-    password_input.click()
-    print("Password field clicked.")
-    password_input.send_keys(password)
-    print("Password entered.")
-
-    # Find and click the login button
-    print("Waiting for login button (ID: ASPxRoundPanel1_btnLogin_CD)...")
-    login_button = WebDriverWait(driver, 20).until(
-        EC.element_to_be_clickable((By.ID, "ASPxRoundPanel1_btnLogin_CD"))
-    )
-    print("Login button is clickable. Attempting to click...")
-    login_button.click()
-    print("Login button clicked.")
-
-    print("Waiting up to 10 seconds for URL to change after login...")
-    WebDriverWait(driver, 10).until(EC.url_changes(login_url))
-
-    current_url = driver.current_url
-    print(f"Current URL after login attempt: {current_url}")
-
-    if "reslogin" not in current_url.lower():
-        print("Login successful! URL has changed.")
-        print(f"Now on page: {driver.current_url}")
-
-        print("Allowing MainPage to settle for 3 seconds...")
-        time.sleep(3)
-
-        try:            # Scrape all meter data (electricity and water meters)
-            all_meter_data = scrape_all_meters(driver)
-            if all_meter_data:
-                print(f"Meter Data: {all_meter_data}")
-            else:
-                print("Failed to retrieve meter data or no meters found.")
-
-            # For backward compatibility, extract electricity meter data as dynamic_values
-            dynamic_values = {}
-            if 'electricity' in all_meter_data:
-                elec_data = all_meter_data['electricity']
-                dynamic_values = {
-                    "Remaining Unit": elec_data.get("Remaining Unit"),
-                    "Remaining Balance": elec_data.get("Remaining Balance"), 
-                    "Last Updated": elec_data.get("Last Updated")
-                }            # V2: Stop here! We have all the meter data we need.
-
-            if all_meter_data:
-                try:
-                    # Ensure we are calling export_usms_data correctly
-                    excel_path = export_usms_data(
-                        hourly_consumption=[],  # Empty list as per existing V2 logic
-                        total_kwh=None,        # None as per existing V2 logic
-                        dynamic_values=dynamic_values, # Pass existing dynamic_values
-                        all_meter_data=all_meter_data  # Pass the main meter data
-                    )
-                    if excel_path:
-                        print(f"\\nData successfully saved to {excel_path}")
-                    else:
-                        print("\\nFailed to save data to Excel.")
-                except Exception as e:
-                    print(f"\\nError saving data to Excel: {e}")
-            else:
-                print("\\nNo meter data to save to Excel.")
-                
-            # MQTT Publishing: Prepare separate payloads for electricity and water
-            electricity_payload = None
-            water_payload = None
-            data_to_publish_exists = False
-
-            if all_meter_data:
-                utc_now = datetime.now(timezone.utc)
-                brunei_tz = timezone(timedelta(hours=8))
-                brunei_now_iso = utc_now.astimezone(brunei_tz).isoformat()
-
-                desired_keys_for_mqtt = ["Remaining Unit", "Remaining Balance", "Last Updated"]
-
-                if 'electricity' in all_meter_data and all_meter_data['electricity']:
-                    source_data_elec = all_meter_data['electricity']
-                    temp_payload_elec = {}
-                    for key in desired_keys_for_mqtt:
-                        if key in source_data_elec and source_data_elec[key] is not None:
-                            temp_payload_elec[key] = source_data_elec[key]
-                    
-                    if temp_payload_elec: # If any of the desired keys were found and have values
-                        electricity_payload = temp_payload_elec
-                        electricity_payload['mqtt_timestamp'] = brunei_now_iso
-                        data_to_publish_exists = True
-                    # else electricity_payload remains None, and data_to_publish_exists is not set to True here
-
-                if 'water' in all_meter_data and all_meter_data['water']:
-                    source_data_water = all_meter_data['water']
-                    temp_payload_water = {}
-                    for key in desired_keys_for_mqtt:
-                        if key in source_data_water and source_data_water[key] is not None:
-                            temp_payload_water[key] = source_data_water[key]
-
-                    if temp_payload_water: # If any of the desired keys were found and have values
-                        water_payload = temp_payload_water
-                        water_payload['mqtt_timestamp'] = brunei_now_iso
-                        data_to_publish_exists = True # Set to true if water data is being published
-                    # else water_payload remains None
-            
-            if data_to_publish_exists:
-                print("\\\\nAttempting to publish USMS data via MQTT to respective topics...")
-                try:
-                    # Call the modified publish_usms_json with separate payloads
-                    if publish_usms_json(electricity_payload, water_payload):
-                        print("✅ USMS data (electricity and/or water) published successfully via MQTT.")
-                    else:
-                        print("❌ Failed to publish some or all USMS data via MQTT. Check mqtt_publisher logs for details.")
-                except Exception as e:
-                    print(f"❌ An error occurred during MQTT publishing for USMS data: {e}")
-            else:
-                print("\\nSkipping MQTT publish for USMS: No data prepared.")
+# Card fields published to each meter's MQTT topic
+MQTT_KEYS = ("Remaining Unit", "Remaining Balance", "Last Updated")
 
-            print("\\n🎯 usmsScraperV2 completed successfully!")
-            print("Collected meter data without navigating to consumption tables.")
+def main(argv=None):
+    """
+    Logs in to USMS, scrapes the meter cards and exports/publishes them.
+    Kept out of module scope so importing this file does not start a browser.
+    """
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    set_client_suffix("usms_v2")
+    parser = argparse.ArgumentParser(description="Scrape USMS meter cards (no consumption tables).")
+    parser.add_argument("--show-browser", action="store_true",
+                        help="run Chrome with a visible window, for debugging")
+    args = parser.parse_args(argv)
 
-        except TimeoutException as nav_te:
-            print(f"A timeout occurred during navigation or interaction after login: {nav_te}")
-            try:
-                driver.switch_to.default_content()
-            except Exception:
-                pass
-        except Exception as nav_e:
-            print(f"An error occurred after login: {nav_e}")
+    # Load credentials from file
+    username, password = load_credentials() # Loads USMS credentials from credentials.json by default
+
+    if not username or not password:
+        log.error("Exiting script due to credential loading issues.")
+        return
+
+    # --- WebDriver Setup ---
+    driver = setup_driver(build_usms_chrome_options(PROFILE_DIR, headless=not args.show_browser))
+    if not driver:
+        log.error("Failed to setup WebDriver. Exiting.")
+        return
+
+    log.debug(f"Navigating to login page: {login_url}")
+    driver.get(login_url)
+
+    # Initialize scraped data variables here to ensure they exist in all paths
+    dynamic_values = {}
+
+    try:
+        # A session kept in the profile makes the site skip the login form
+        if "reslogin" not in driver.current_url.lower():
+            log.info(f"Already logged in via the saved session; now on page: {driver.current_url}")
+        else:
+            # Wait for the username field to be present and visible
+            log.debug("Waiting for username field (ID: ASPxRoundPanel1_txtUsername_I)...")
+            wait(driver, 20).until(
+                EC.presence_of_element_located((By.ID, "ASPxRoundPanel1_txtUsername_I"))
+            )
+
+            # Set both fields and press the login button in one script call instead of typing key by key
+            submit_usms_login(driver, username, password)
+            log.debug("Username and password entered. Login button clicked.")
+
+            log.debug("Waiting up to 10 seconds for URL to change after login...")
+            wait(driver, 10).until(EC.url_changes(login_url))
+
+        current_url = driver.current_url
+        log.debug(f"Current URL after login attempt: {current_url}")
+
+        if "reslogin" not in current_url.lower():
+            log.info("Login successful! URL has changed.")
+            log.debug(f"Now on page: {driver.current_url}")
+
+            # Rather than a fixed settle delay, wait until MainPage's frame has a meter card in it
+            log.debug("Waiting for MainPage to load the meter cards...")
+            wait(driver, 15).until(
+                EC.frame_to_be_available_and_switch_to_it((By.ID, "MyFrame"))
+            )
             try:
-                driver.switch_to.default_content()
-            except Exception:
-                pass
+                wait(driver, 15).until(
+                    EC.presence_of_element_located((By.CSS_SELECTOR, "[id^='ASPxCardView1_DXDataCard']"))
+                )
+                log.debug("Switched to iframe 'MyFrame'; meter cards loaded.")
+            except TimeoutException:
+                # An account without meters never renders a card; let the scrape report no meters
+                log.warning("No meter cards appeared in 'MyFrame'.")
+
+            try:            # Scrape all meter data (electricity and water meters)
+                all_meter_data = scrape_all_meters(driver, already_in_frame=True)
+                if all_meter_data:
+                    log.info(f"Meter Data: {all_meter_data}")
+                else:
+                    log.warning("Failed to retrieve meter data or no meters found.")
+
+                # For backward compatibility, extract electricity meter data as dynamic_values
+                dynamic_values = {}
+                if 'electricity' in all_meter_data:
+                    elec_data = all_meter_data['electricity']
+                    dynamic_values = {
+                        "Remaining Unit": elec_data.get("Remaining Unit"),
+                        "Remaining Balance": elec_data.get("Remaining Balance"), 
+                        "Last Updated": elec_data.get("Last Updated")
+                    }            # V2: Stop here! We have all the meter data we need.
+
+                # MQTT Publishing: Prepare separate payloads for electricity and water
+                brunei_now_iso = datetime.now(BRUNEI_TZ).isoformat()
+                electricity_payload = build_mqtt_payload(all_meter_data.get('electricity'), brunei_now_iso)
+                water_payload = build_mqtt_payload(all_meter_data.get('water'), brunei_now_iso)
+                data_to_publish_exists = bool(electricity_payload or water_payload)
+
+                # The Excel file and the MQTT messages don't depend on each other, so write
+                # and send them side by side rather than one after the other
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    executor.submit(save_to_excel, dynamic_values, all_meter_data)
+                    if data_to_publish_exists:
+                        executor.submit(publish_to_mqtt, electricity_payload, water_payload)
+                    else:
+                        log.warning("\nSkipping MQTT publish for USMS: No data prepared.")
 
-    elif "Invalid IC Number or Password" in driver.page_source:
-        print("Login failed: Invalid IC Number or Password message found on page.")
-    elif username_field_name in driver.page_source:
-        print("Login failed: Still on the login page (login fields detected).")
-    else:
-        print("Login status uncertain. Please check the browser window and console output.")
-        print("Page title:", driver.title)
+                log.info("\n🎯 usmsScraperV2 completed successfully!")
+                log.info("Collected meter data without navigating to consumption tables.")
+
+            except TimeoutException as nav_te:
+                log.error(f"A timeout occurred during navigation or interaction after login: {nav_te}")
+                try:
+                    driver.switch_to.default_content()
+                except Exception:
+                    pass
+            except Exception as nav_e:
+                log.error(f"An error occurred after login: {nav_e}")
+                try:
+                    driver.switch_to.default_content()
+                except Exception:
+                    pass
 
-    print("Script finished checks. Browser will close shortly.")
+        else:
+            # Fetch the page source once and check it for both failure markers
+            page_source = driver.page_source
+            if "Invalid IC Number or Password" in page_source:
+                log.warning("Login failed: Invalid IC Number or Password message found on page.")
+            elif username_field_name in page_source:
+                log.warning("Login failed: Still on the login page (login fields detected).")
+            else:
+                log.warning("Login status uncertain. Please check the browser window and console output.")
+                log.warning(f"Page title: {driver.title}")
+
+        log.info("Script finished checks. Browser will close shortly.")
+
+    except TimeoutException as te:
+        log.error(f"A timeout occurred during an explicit wait: {te}")
+    except Exception as e:
+        log.error(f"An error occurred: {e}")
 
-except TimeoutException as te:
-    print(f"A timeout occurred during an explicit wait: {te}")
-except Exception as e:
-    print(f"An error occurred: {e}")
+    finally:
+        log.info("Closing the browser.")
+        driver.quit()
+        # atexit does not run reliably in run_all.py's worker processes; flush and disconnect now
+        close_client()
 
-finally:
-    print("Closing the browser.")
-    driver.quit()
+if __name__ == "__main__":
+    main()